@@ -0,0 +1,175 @@
+"""Poll cycle benchmark of the TTlock client against the mock API server.
+
+For each fleet size, runs full update_devices cycles and reports the cycle
+latency, the number of requests sent and the peak memory allocated.
+
+    python -m benchmarks.bench_poll_cycle --fleet 1x10 --fleet 10x20 --cycles 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+
+from benchmarks.mock_server import MockTTlockServer  # noqa: E402
+from custom_components.ttlock import (  # noqa: E402
+    CONFIG_SCHEMA,
+    TTlock,
+    build_request_scheduler,
+)
+from custom_components.ttlock.auth import save_json_atomic  # noqa: E402
+from custom_components.ttlock.const import CONF_ACCOUNTS, DOMAIN  # noqa: E402
+
+
+def parse_fleet(value):
+    """Parse a GATEWAYSxLOCKS fleet size."""
+    _gateways, _locks = value.lower().split("x")
+    return int(_gateways), int(_locks)
+
+
+async def async_bench_fleet(gateways, locks_per_gateway, args):
+    """Run the cycles of one fleet size, return its results."""
+    server = MockTTlockServer(
+        gateways=gateways,
+        locks_per_gateway=locks_per_gateway,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        token_expiry_rate=args.token_expiry_rate,
+    )
+    base_url = await server.start()
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant()
+        hass.config.config_dir = config_dir
+        hass.config.api = SimpleNamespace(base_url="http://127.0.0.1:8123")
+        os.makedirs(os.path.join(config_dir, "custom_components", DOMAIN))
+
+        config = CONFIG_SCHEMA(
+            {
+                DOMAIN: {
+                    "client_id": "bench",
+                    "client_secret": "bench",
+                    "access_token": server.access_token,
+                    "refresh_token": server.refresh_token,
+                    "api_uri": base_url,
+                    "max_concurrent_requests": args.concurrency,
+                    "max_requests_per_second": args.rate,
+                    "request_burst": args.burst,
+                    # Each cycle measures the requests of a full sweep.
+                    "cache_ttl": {
+                        "api_gateway_resource": 0,
+                        "api_gateway_locks_resource": 0,
+                    },
+                }
+            }
+        )
+        api = TTlock(
+            hass,
+            config,
+            config[DOMAIN][CONF_ACCOUNTS][0],
+            build_request_scheduler(config[DOMAIN]),
+        )
+        await hass.async_add_executor_job(
+            save_json_atomic,
+            api.full_path_token_file,
+            {
+                "access_token": server.access_token,
+                "refresh_token": server.refresh_token,
+                "expire_date": time.time() + 86400 * 90,
+            },
+        )
+        await api.token.async_load()
+
+        durations = []
+        requests = []
+        errors = 0
+        tracemalloc.start()
+        try:
+            for _ in range(args.cycles):
+                _count = server.request_count
+                _start = time.perf_counter()
+                try:
+                    await api.async_update_devices()
+                except Exception:
+                    errors += 1
+                durations.append(time.perf_counter() - _start)
+                requests.append(server.request_count - _count)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            api.token.async_stop()
+            await hass.async_stop(force=True)
+            await server.stop()
+
+    return {
+        "gateways": gateways,
+        "locks": gateways * locks_per_gateway,
+        "cycles": args.cycles,
+        "failed_cycles": errors,
+        "latency_min": min(durations),
+        "latency_median": statistics.median(durations),
+        "latency_max": max(durations),
+        "requests_per_cycle": statistics.mean(requests),
+        "peak_memory_kib": peak_memory / 1024,
+    }
+
+
+def print_results(results):
+    print(
+        f"{'gateways':>8} {'locks':>7} {'min s':>8} {'median s':>9} {'max s':>8} "
+        f"{'requests':>9} {'peak KiB':>9} {'failed':>6}"
+    )
+    for result in results:
+        print(
+            f"{result['gateways']:>8} {result['locks']:>7} "
+            f"{result['latency_min']:>8.3f} {result['latency_median']:>9.3f} "
+            f"{result['latency_max']:>8.3f} {result['requests_per_cycle']:>9.0f} "
+            f"{result['peak_memory_kib']:>9.0f} {result['failed_cycles']:>6}"
+        )
+
+
+async def async_main(args):
+    results = []
+    for gateways, locks_per_gateway in args.fleet or [(1, 10), (10, 20)]:
+        results.append(await async_bench_fleet(gateways, locks_per_gateway, args))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--fleet",
+        type=parse_fleet,
+        action="append",
+        help="GATEWAYSxLOCKS per gateway, can be repeated (default 1x10 and 10x20)",
+    )
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-expiry-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=1000.0, help="requests/s")
+    parser.add_argument("--burst", type=int, default=1000)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(async_main(args))
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as outfile:
+            json.dump(results, outfile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""Local stand-in for the TTlock cloud API.
+
+Serves a synthetic account of N gateways with M locks each, with
+configurable latency, error rate and access token expiry.
+
+Run it standalone to point a development Home Assistant at it:
+
+    python -m benchmarks.mock_server --gateways 10 --locks 20 --port 8180
+
+and set ``api_uri: http://127.0.0.1:8180`` in the ttlock configuration.
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+
+from aiohttp import web
+
+OAUTH_RESOURCE = "oauth2/token"
+GATEWAY_RESOURCE = "v3/gateway/list"
+GATEWAY_LOCKS_RESOURCE = "v3/gateway/listLock"
+LOCK_LIST_RESOURCE = "v3/lock/list"
+LOCK_RESOURCE = "v3/lock/lock"
+UNLOCK_RESOURCE = "v3/lock/unlock"
+QUERY_OPEN_STATE_RESOURCE = "v3/lock/queryOpenState"
+QUERY_ELECTRIC_QUANTITY_RESOURCE = "v3/lock/queryElectricQuantity"
+
+TOKEN_EXPIRES_IN = 7776000
+
+
+class MockTTlockServer:
+    """aiohttp application implementing the TTlock resources used by ttlock."""
+
+    def __init__(
+        self,
+        gateways=1,
+        locks_per_gateway=1,
+        latency=0.0,
+        latency_jitter=0.0,
+        error_rate=0.0,
+        token_expiry_rate=0.0,
+        seed=0,
+    ):
+        """Initialize the server and its synthetic account."""
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.token_expiry_rate = token_expiry_rate
+        self.requests = Counter()
+        self.access_token = "access-token-0"
+        self.refresh_token = "refresh-token-0"
+        self._token_generation = 0
+        self._random = random.Random(seed)
+        self._runner = None
+
+        self.gateways = [
+            {
+                "gatewayId": _gateway_id,
+                "gatewayMac": f"52:1C:{_gateway_id >> 8 & 0xFF:02X}:{_gateway_id & 0xFF:02X}",
+                "gatewayName": f"Gateway {_gateway_id}",
+                "gatewayVersion": 2,
+                "isOnline": 1,
+                "lockNum": locks_per_gateway,
+            }
+            for _gateway_id in range(1, gateways + 1)
+        ]
+        self.locks = {}
+        self.gateway_locks = {}
+        for gateway in self.gateways:
+            _lock_ids = self.gateway_locks[gateway["gatewayId"]] = []
+            for _index in range(locks_per_gateway):
+                _lock_id = gateway["gatewayId"] * 100000 + _index
+                _lock_ids.append(_lock_id)
+                self.locks[_lock_id] = {
+                    "lockId": _lock_id,
+                    "lockMac": f"D6:{_lock_id >> 16 & 0xFF:02X}:{_lock_id >> 8 & 0xFF:02X}:{_lock_id & 0xFF:02X}",
+                    "lockName": f"Lock {_lock_id}",
+                    "lockAlias": f"Lock {_lock_id}",
+                    "rssi": -60 - self._random.randint(0, 30),
+                    "updateDate": 1580000000000,
+                    "electricQuantity": self._random.randint(5, 100),
+                    "state": self._random.randint(0, 1),
+                }
+
+        self.app = web.Application()
+        self.app.router.add_post(f"/{OAUTH_RESOURCE}", self._oauth)
+        self.app.router.add_post(f"/{GATEWAY_RESOURCE}", self._gateway_list)
+        self.app.router.add_post(f"/{GATEWAY_LOCKS_RESOURCE}", self._gateway_locks)
+        self.app.router.add_post(f"/{LOCK_LIST_RESOURCE}", self._lock_list)
+        self.app.router.add_post(f"/{LOCK_RESOURCE}", self._lock_command)
+        self.app.router.add_post(f"/{UNLOCK_RESOURCE}", self._unlock_command)
+        self.app.router.add_post(f"/{QUERY_OPEN_STATE_RESOURCE}", self._open_state)
+        self.app.router.add_post(
+            f"/{QUERY_ELECTRIC_QUANTITY_RESOURCE}", self._electric_quantity
+        )
+
+    @property
+    def request_count(self):
+        return sum(self.requests.values())
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving, return the base url."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        _site = web.TCPSite(self._runner, host, port)
+        await _site.start()
+        _port = _site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{_port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def expire_token(self):
+        """Invalidate the current access token, the next request gets 10003."""
+        self.access_token = f"expired-{self.access_token}"
+
+    async def _prepare(self, request, resource):
+        """Count, delay and fail the request as configured, return its form."""
+        self.requests[resource] += 1
+        if self.latency or self.latency_jitter:
+            await asyncio.sleep(
+                self.latency + self._random.uniform(0, self.latency_jitter)
+            )
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise web.HTTPServiceUnavailable()
+        return await request.post()
+
+    def _check_token(self, form):
+        if self.token_expiry_rate and self._random.random() < self.token_expiry_rate:
+            self.expire_token()
+        if form.get("accessToken") != self.access_token:
+            return web.json_response(
+                {"errcode": 10003, "errmsg": "invalid token", "description": ""}
+            )
+        return None
+
+    def _lock(self, form):
+        return self.locks.get(int(form.get("lockId", 0)))
+
+    async def _oauth(self, request):
+        form = await self._prepare(request, OAUTH_RESOURCE)
+        if form.get("refresh_token") != self.refresh_token:
+            return web.json_response(
+                {"errcode": 10011, "errmsg": "invalid refresh_token"}
+            )
+        self._token_generation += 1
+        self.access_token = f"access-token-{self._token_generation}"
+        self.refresh_token = f"refresh-token-{self._token_generation}"
+        return web.json_response(
+            {
+                "access_token": self.access_token,
+                "refresh_token": self.refresh_token,
+                "uid": 1,
+                "openid": 1,
+                "scope": "user,key,room",
+                "token_type": "Bearer",
+                "expires_in": TOKEN_EXPIRES_IN,
+            }
+        )
+
+    async def _gateway_list(self, request):
+        form = await self._prepare(request, GATEWAY_RESOURCE)
+        _error = self._check_token(form)
+        if _error is not None:
+            return _error
+        _page_no = int(form.get("pageNo", 1))
+        _page_size = int(form.get("pageSize", 20))
+        _start = (_page_no - 1) * _page_size
+        return web.json_response(
+            {
+                "list": self.gateways[_start : _start + _page_size],
+                "pageNo": _page_no,
+                "pageSize": _page_size,
+                "pages": -(-len(self.gateways) // _page_size),
+                "total": len(self.gateways),
+            }
+        )
+
+    async def _gateway_locks(self, request):
+        form = await self._prepare(request, GATEWAY_LOCKS_RESOURCE)
+        _error = self._check_token(form)
+        if _error is not None:
+            return _error
+        _lock_ids = self.gateway_locks.get(int(form.get("gatewayId", 0)), [])
+        return web.json_response(
+            {
+                "list": [
+                    {
+                        key: self.locks[_lock_id][key]
+                        for key in (
+                            "lockId",
+                            "lockMac",
+                            "lockName",
+                            "lockAlias",
+                            "rssi",
+                            "updateDate",
+                        )
+                    }
+                    for _lock_id in _lock_ids
+                ]
+            }
+        )
+
+    async def _lock_list(self, request):
+        form = await self._prepare(request, LOCK_LIST_RESOURCE)
+        _error = self._check_token(form)
+        if _error is not None:
+            return _error
+        _page_no = int(form.get("pageNo", 1))
+        _page_size = int(form.get("pageSize", 20))
+        _start = (_page_no - 1) * _page_size
+        _locks = list(self.locks.values())
+        return web.json_response(
+            {
+                "list": [
+                    {
+                        key: lock[key]
+                        for key in (
+                            "lockId",
+                            "lockMac",
+                            "lockName",
+                            "lockAlias",
+                            "electricQuantity",
+                        )
+                    }
+                    for lock in _locks[_start : _start + _page_size]
+                ],
+                "pageNo": _page_no,
+                "pageSize": _page_size,
+                "pages": -(-len(_locks) // _page_size),
+                "total": len(_locks),
+            }
+        )
+
+    async def _lock_command(self, request):
+        return await self._command(request, LOCK_RESOURCE, 0)
+
+    async def _unlock_command(self, request):
+        return await self._command(request, UNLOCK_RESOURCE, 1)
+
+    async def _command(self, request, resource, state):
+        form = await self._prepare(request, resource)
+        _error = self._check_token(form)
+        if _error is not None:
+            return _error
+        lock = self._lock(form)
+        if lock is None:
+            return web.json_response({"errcode": -1003, "errmsg": "lock not exist"})
+        lock["state"] = state
+        return web.json_response({"errcode": 0, "errmsg": "none error message"})
+
+    async def _open_state(self, request):
+        form = await self._prepare(request, QUERY_OPEN_STATE_RESOURCE)
+        _error = self._check_token(form)
+        if _error is not None:
+            return _error
+        lock = self._lock(form)
+        if lock is None:
+            return web.json_response({"errcode": -1003, "errmsg": "lock not exist"})
+        return web.json_response({"state": lock["state"]})
+
+    async def _electric_quantity(self, request):
+        form = await self._prepare(request, QUERY_ELECTRIC_QUANTITY_RESOURCE)
+        _error = self._check_token(form)
+        if _error is not None:
+            return _error
+        lock = self._lock(form)
+        if lock is None:
+            return web.json_response({"errcode": -1003, "errmsg": "lock not exist"})
+        return web.json_response({"electricQuantity": lock["electricQuantity"]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8180)
+    parser.add_argument("--gateways", type=int, default=1)
+    parser.add_argument("--locks", type=int, default=1, help="locks per gateway")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-expiry-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockTTlockServer(
+        gateways=args.gateways,
+        locks_per_gateway=args.locks,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        token_expiry_rate=args.token_expiry_rate,
+    )
+    print(f"access_token: {server.access_token} refresh_token: {server.refresh_token}")
+    web.run_app(server.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,58 +4,202 @@ Component to integrate with TTlock API.
 For more details about this component, please refer to
 https://github.com/tonyldo/lock.ttlock
 """
-import requests
-import json
-import logging
-import os
 import asyncio
-import datetime
+import logging
+import time
+import aiohttp
 import voluptuous as vol
-from datetime import datetime, time, timedelta
+from datetime import timedelta
 
 import homeassistant.helpers.config_validation as cv
 
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import Entity
-from homeassistant.helpers.event import async_track_time_interval
 from homeassistant import config_entries
 from homeassistant.helpers import discovery
-from homeassistant.const import CONF_SCAN_INTERVAL
+from homeassistant.const import CONF_NAME, CONF_SCAN_INTERVAL
+from homeassistant.core import callback
 from integrationhelper.const import CC_STARTUP_VERSION
 
 from .const import (
+    ATTR_CYCLES,
+    ATTR_HOURS,
+    ATTR_LOCK_ID,
     CONF_ACCESS_TOKEN,
+    CONF_ACCOUNT,
+    CONF_ACCOUNTS,
     CONF_API_GATEWAY_LOCKS_RESOURCE,
     CONF_API_GATEWAY_RESOURCE,
+    CONF_API_LOCK_LIST_RESOURCE,
+    CONF_API_LOCK_RECORDS_RESOURCE,
+    CONF_API_LOCK_RESOURCE,
     CONF_API_OAUTH_RESOURCE,
     CONF_API_QUERY_OPEN_STATE_RESOURCE,
+    CONF_API_UNLOCK_RESOURCE,
     CONF_API_QUERY_LOCK_ELETRIC_QUANTITY,
     CONF_API_URI,
+    CONF_BATTERY_BATCH,
+    CONF_BATTERY_SCAN_INTERVAL,
+    CONF_CALLBACK,
+    CONF_CYCLE_TIMEOUT,
+    CONF_CACHE_MAX_SIZE,
+    CONF_CACHE_TTL,
     CONF_CLIENT_ID,
     CONF_CLIENT_SECRET,
+    CONF_GATEWAY_PAGE_SIZE,
+    CONF_GATEWAY_PREFETCH,
+    CONF_LOCK_PAGE_SIZE,
+    CONF_MAX_CONCURRENT_REQUESTS,
+    CONF_MAX_REQUESTS_PER_SECOND,
+    CONF_MAX_RETRIES,
     CONF_REFRESH_TOKEN,
+    CONF_REQUEST_BURST,
+    CONF_REQUEST_TIMEOUT,
+    CONF_PUSH_SCAN_INTERVAL,
+    CONF_RECORDS,
+    CONF_RECORDS_FILENAME,
+    CONF_RECORDS_LOOKBACK,
+    CONF_RECORDS_SCAN_INTERVAL,
+    CONF_SCAN_JITTER,
+    CONF_STAGGERED_POLLING,
+    CONF_SNAPSHOT_FILENAME,
     CONF_TOKEN_FILENAME,
+    CONF_TOPOLOGY_SCAN_INTERVAL,
+    DATA_COORDINATOR,
+    DATA_PROFILER,
+    DATA_SCHEDULER,
+    DEFAULT_CACHE_TTL,
     DEFAULT_NAME,
     DOMAIN,
     ISSUE_URL,
+    CIRCUIT_BREAKER_RESET_TIMEOUT,
+    CALLBACK_SECRET_FILENAME,
+    CALLBACK_URL,
+    CIRCUIT_BREAKER_THRESHOLD,
     PLATFORMS,
+    PRIORITY_COMMAND,
+    PRIORITY_DEFAULT,
+    PRIORITY_ELECTRIC_QUANTITY,
+    PRIORITY_OPEN_STATE,
+    PRIORITY_RECORDS,
+    PRIORITY_TOPOLOGY,
+    REFRESH_ELECTRIC_QUANTITY,
+    RECORDS_PAGE_SIZE,
+    REFRESH_OPEN_STATE,
+    REFRESH_RECORDS,
+    REFRESH_TOPOLOGY,
     REQUIRED_FILES,
+    SERVICE_DUMP_DIAGNOSTICS,
+    SERVICE_EXPORT_RECORDS,
+    SERVICE_PROFILE,
+    SERVICE_REFRESH,
+    SIGNAL_LOCK_UPDATED,
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_MAX,
+    TOKEN_ERROR_CODES,
     VERSION,
 )
 
+from .auth import TTlockTokenManager, load_json, save_json_atomic
+from .cache import TTLCache
+from .callback import TTlockCallbackView, load_callback_secret
+from .coordinator import TTlockCoordinator
+from .exceptions import (
+    TTlockApiError,
+    TTlockError,
+    TTlockHttpError,
+    TTlockTokenError,
+)
+from .metrics import TTlockMetrics
+from .models import Gateway, LockState
+from .profiler import TTlockProfiler
+from .records import TTlockRecordStore
+from .scheduler import RequestScheduler
+
 _LOGGER = logging.getLogger(__name__)
 
+ACCOUNT_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.slug,
+        vol.Required(CONF_CLIENT_ID): cv.string,
+        vol.Required(CONF_CLIENT_SECRET): cv.string,
+        vol.Required(CONF_ACCESS_TOKEN): cv.string,
+        vol.Required(CONF_REFRESH_TOKEN): cv.string,
+        vol.Optional(CONF_TOKEN_FILENAME): cv.string,
+        vol.Optional(CONF_SNAPSHOT_FILENAME): cv.string,
+        vol.Optional(CONF_RECORDS_FILENAME): cv.string,
+    }
+)
+
+
+def _accounts(conf):
+    """Move a top level account to the accounts list and name the account files.
+
+    The first account keeps the token.json, snapshot.json and records.db file
+    names, the others get their name as suffix.
+    """
+    _top_level = {
+        key: conf.pop(key)
+        for key in (
+            CONF_CLIENT_ID,
+            CONF_CLIENT_SECRET,
+            CONF_ACCESS_TOKEN,
+            CONF_REFRESH_TOKEN,
+            CONF_TOKEN_FILENAME,
+            CONF_SNAPSHOT_FILENAME,
+            CONF_RECORDS_FILENAME,
+        )
+        if key in conf
+    }
+    _accounts = conf.get(CONF_ACCOUNTS, [])
+    if CONF_CLIENT_ID in _top_level:
+        _accounts = [ACCOUNT_SCHEMA(_top_level)] + _accounts
+    if not _accounts:
+        raise vol.Invalid(f"Configure at least one account, in {CONF_ACCOUNTS}")
+
+    _names = [account[CONF_NAME] for account in _accounts]
+    if len(set(_names)) != len(_names):
+        raise vol.Invalid("The account names must be unique")
+
+    for _index, account in enumerate(_accounts):
+        _suffix = "" if _index == 0 else f"_{account[CONF_NAME]}"
+        account.setdefault(CONF_TOKEN_FILENAME, f"token{_suffix}.json")
+        account.setdefault(CONF_SNAPSHOT_FILENAME, f"snapshot{_suffix}.json")
+        account.setdefault(CONF_RECORDS_FILENAME, f"records{_suffix}.db")
+
+    conf[CONF_ACCOUNTS] = _accounts
+    return conf
+
+
 CONFIG_SCHEMA = vol.Schema(
     {
-        DOMAIN: vol.Schema(
+        DOMAIN: vol.All(
             {
-                vol.Required(CONF_CLIENT_ID): cv.string,
-                vol.Required(CONF_CLIENT_SECRET): cv.string,
-                vol.Required(CONF_ACCESS_TOKEN): cv.string,
-                vol.Required(CONF_REFRESH_TOKEN): cv.string,
+                vol.Inclusive(CONF_CLIENT_ID, CONF_ACCOUNT): cv.string,
+                vol.Inclusive(CONF_CLIENT_SECRET, CONF_ACCOUNT): cv.string,
+                vol.Inclusive(CONF_ACCESS_TOKEN, CONF_ACCOUNT): cv.string,
+                vol.Inclusive(CONF_REFRESH_TOKEN, CONF_ACCOUNT): cv.string,
+                vol.Optional(CONF_ACCOUNTS): vol.All(cv.ensure_list, [ACCOUNT_SCHEMA]),
                 vol.Optional(CONF_API_URI, default="https://api.ttlock.com"): cv.string,
                 vol.Optional(
                     CONF_SCAN_INTERVAL, default=timedelta(seconds=30)
                 ): cv.time_period,
+                vol.Optional(
+                    CONF_SCAN_JITTER, default=timedelta(seconds=0)
+                ): cv.time_period,
+                vol.Optional(
+                    CONF_TOPOLOGY_SCAN_INTERVAL, default=timedelta(hours=1)
+                ): cv.time_period,
+                vol.Optional(
+                    CONF_BATTERY_SCAN_INTERVAL, default=timedelta(hours=1)
+                ): cv.time_period,
+                vol.Optional(CONF_STAGGERED_POLLING, default=False): cv.boolean,
+                vol.Optional(CONF_CYCLE_TIMEOUT): cv.time_period,
+                vol.Optional(CONF_CALLBACK, default=False): cv.boolean,
+                vol.Optional(
+                    CONF_PUSH_SCAN_INTERVAL, default=timedelta(minutes=30)
+                ): cv.time_period,
                 vol.Optional(
                     CONF_API_OAUTH_RESOURCE, default="oauth2/token"
                 ): cv.string,
@@ -72,8 +216,55 @@ CONFIG_SCHEMA = vol.Schema(
                     CONF_API_QUERY_LOCK_ELETRIC_QUANTITY,
                     default="v3/lock/queryElectricQuantity",
                 ): cv.string,
-                vol.Optional(CONF_TOKEN_FILENAME, default="token.json"): cv.string,
-            }
+                vol.Optional(
+                    CONF_API_LOCK_LIST_RESOURCE, default="v3/lock/list"
+                ): cv.string,
+                vol.Optional(CONF_API_LOCK_RESOURCE, default="v3/lock/lock"): cv.string,
+                vol.Optional(
+                    CONF_API_UNLOCK_RESOURCE, default="v3/lock/unlock"
+                ): cv.string,
+                vol.Optional(
+                    CONF_API_LOCK_RECORDS_RESOURCE, default="v3/lockRecord/list"
+                ): cv.string,
+                vol.Optional(CONF_TOKEN_FILENAME): cv.string,
+                vol.Optional(CONF_SNAPSHOT_FILENAME): cv.string,
+                vol.Optional(CONF_RECORDS_FILENAME): cv.string,
+                vol.Optional(CONF_RECORDS, default=False): cv.boolean,
+                vol.Optional(
+                    CONF_RECORDS_SCAN_INTERVAL, default=timedelta(hours=1)
+                ): cv.time_period,
+                vol.Optional(
+                    CONF_RECORDS_LOOKBACK, default=timedelta(days=7)
+                ): cv.time_period,
+                vol.Optional(CONF_CACHE_TTL, default={}): vol.Schema(
+                    {
+                        vol.In(
+                            [
+                                CONF_API_GATEWAY_RESOURCE,
+                                CONF_API_GATEWAY_LOCKS_RESOURCE,
+                                CONF_API_QUERY_OPEN_STATE_RESOURCE,
+                                CONF_API_QUERY_LOCK_ELETRIC_QUANTITY,
+                                CONF_API_LOCK_LIST_RESOURCE,
+                            ]
+                        ): cv.time_period
+                    }
+                ),
+                vol.Optional(CONF_CACHE_MAX_SIZE, default=256): cv.positive_int,
+                vol.Optional(
+                    CONF_REQUEST_TIMEOUT, default=timedelta(seconds=10)
+                ): cv.time_period,
+                vol.Optional(CONF_MAX_CONCURRENT_REQUESTS, default=10): cv.positive_int,
+                vol.Optional(CONF_GATEWAY_PAGE_SIZE, default=20): cv.positive_int,
+                vol.Optional(CONF_GATEWAY_PREFETCH, default=False): cv.boolean,
+                vol.Optional(CONF_BATTERY_BATCH, default=True): cv.boolean,
+                vol.Optional(CONF_LOCK_PAGE_SIZE, default=100): cv.positive_int,
+                vol.Optional(CONF_MAX_REQUESTS_PER_SECOND, default=5): vol.All(
+                    vol.Coerce(float), vol.Range(min=0, min_included=False)
+                ),
+                vol.Optional(CONF_REQUEST_BURST, default=10): cv.positive_int,
+                vol.Optional(CONF_MAX_RETRIES, default=3): cv.positive_int,
+            },
+            _accounts,
         )
     },
     extra=vol.ALLOW_EXTRA,
@@ -91,39 +282,241 @@ async def async_setup(hass, config):
         CC_STARTUP_VERSION.format(name=DOMAIN, version=VERSION, issue_link=ISSUE_URL)
     )
 
-    hass.data[DOMAIN] = TTlock(hass, config)
+    # Every account shares the request scheduler, and the aiohttp session of
+    # Home Assistant.
+    scheduler = hass.data[DATA_SCHEDULER] = build_request_scheduler(config[DOMAIN])
+    hass.data[DOMAIN] = {}
+    hass.data[DATA_COORDINATOR] = {}
+    _intervals = {
+        REFRESH_TOPOLOGY: config[DOMAIN].get(CONF_TOPOLOGY_SCAN_INTERVAL),
+        REFRESH_ELECTRIC_QUANTITY: config[DOMAIN].get(CONF_BATTERY_SCAN_INTERVAL),
+        REFRESH_OPEN_STATE: config[DOMAIN].get(CONF_SCAN_INTERVAL),
+    }
+    if config[DOMAIN].get(CONF_RECORDS):
+        _intervals[REFRESH_RECORDS] = config[DOMAIN].get(CONF_RECORDS_SCAN_INTERVAL)
+    for account in config[DOMAIN][CONF_ACCOUNTS]:
+        api = TTlock(hass, config, account, scheduler)
+        hass.data[DOMAIN][api.name] = api
+        hass.data[DATA_COORDINATOR][api.name] = TTlockCoordinator(
+            hass,
+            api,
+            _intervals,
+            config[DOMAIN].get(CONF_SCAN_JITTER),
+            config[DOMAIN].get(CONF_PUSH_SCAN_INTERVAL),
+            config[DOMAIN].get(CONF_STAGGERED_POLLING),
+            config[DOMAIN].get(CONF_CYCLE_TIMEOUT),
+        )
 
-    # Check the token validated
-    try:
-        hass.data[DOMAIN].check_token_file()
-    except Exception:
+    _results = await asyncio.gather(
+        *[
+            _async_setup_account(hass, hass.data[DOMAIN][_name], _coordinator)
+            for _name, _coordinator in hass.data[DATA_COORDINATOR].items()
+        ]
+    )
+    for _name, _result in zip(list(hass.data[DOMAIN]), _results):
+        if not _result:
+            del hass.data[DOMAIN][_name]
+            del hass.data[DATA_COORDINATOR][_name]
+    if not hass.data[DOMAIN]:
         return False
 
     # Load platforms
     for platform in PLATFORMS:
         discovery.load_platform(hass, platform, DOMAIN, {}, config)
 
-    def update_devices(event_time):
-        asyncio.run_coroutine_threadsafe(hass.data[DOMAIN].async_update(), hass.loop)
+    for coordinator in hass.data[DATA_COORDINATOR].values():
+        coordinator.async_start()
+
+    if config[DOMAIN].get(CONF_CALLBACK):
+        _secret = await hass.async_add_executor_job(
+            load_callback_secret,
+            f"{hass.config.path()}/custom_components/{DOMAIN}/{CALLBACK_SECRET_FILENAME}",
+        )
+        hass.http.register_view(
+            TTlockCallbackView(
+                hass.data[DATA_COORDINATOR],
+                _secret,
+                {api.client_id for api in hass.data[DOMAIN].values()},
+            )
+        )
+        _LOGGER.info(
+            "Set the TTlock callback URL to %s%s",
+            hass.config.api.base_url,
+            CALLBACK_URL.format(secret=_secret),
+        )
+
+    async def async_refresh(call):
+        """Refresh every lock now, or wait for the refresh in flight."""
+        _coordinators = hass.data[DATA_COORDINATOR]
+        if CONF_ACCOUNT in call.data:
+            _coordinators = {
+                call.data[CONF_ACCOUNT]: _coordinators[call.data[CONF_ACCOUNT]]
+            }
+        await asyncio.gather(
+            *[
+                _coordinator.async_refresh(force=True)
+                for _coordinator in _coordinators.values()
+            ]
+        )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_REFRESH,
+        async_refresh,
+        schema=vol.Schema(
+            {vol.Optional(CONF_ACCOUNT): vol.In(list(hass.data[DOMAIN]))}
+        ),
+    )
+
+    async def async_dump_diagnostics(call):
+        """Write the integration diagnostics to a json file."""
+        _filename = hass.config.path(f"{DOMAIN}_diagnostics.json")
+        _diagnostics = {
+            "open_circuits": [
+                _endpoint
+                for _endpoint, _breaker in scheduler.breakers.items()
+                if _breaker.is_open
+            ],
+            "accounts": {
+                _name: api.get_diagnostics() for _name, api in hass.data[DOMAIN].items()
+            },
+        }
+        await hass.async_add_executor_job(save_json_atomic, _filename, _diagnostics)
+        _LOGGER.info("TTlock diagnostics written to %s", _filename)
 
-    async_track_time_interval(
-        hass, update_devices, hass.data[DOMAIN].get_scan_interval()
+    hass.services.async_register(
+        DOMAIN, SERVICE_DUMP_DIAGNOSTICS, async_dump_diagnostics
     )
 
+    async def async_profile(call):
+        """Profile the next refresh cycles, the trace is written at their end."""
+        if hass.data.get(DATA_PROFILER) is not None:
+            _LOGGER.warning("A TTlock profile is already running")
+            return
+        _names = (
+            [call.data[CONF_ACCOUNT]]
+            if CONF_ACCOUNT in call.data
+            else list(hass.data[DOMAIN])
+        )
+        _profiler = hass.data[DATA_PROFILER] = TTlockProfiler(
+            hass,
+            [
+                (hass.data[DOMAIN][_name], hass.data[DATA_COORDINATOR][_name])
+                for _name in _names
+            ],
+            call.data[ATTR_CYCLES],
+        )
+        _profiler.async_start()
+        hass.async_create_task(_async_write_profile(_profiler))
+
+    async def _async_write_profile(profiler):
+        try:
+            _trace = await profiler.async_wait()
+        finally:
+            profiler.async_stop()
+            hass.data[DATA_PROFILER] = None
+        _filename = hass.config.path(f"{DOMAIN}_profile.json")
+        await hass.async_add_executor_job(save_json_atomic, _filename, _trace)
+        _LOGGER.info("TTlock profile written to %s", _filename)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PROFILE,
+        async_profile,
+        schema=vol.Schema(
+            {
+                vol.Optional(CONF_ACCOUNT): vol.In(list(hass.data[DOMAIN])),
+                vol.Optional(ATTR_CYCLES, default=1): cv.positive_int,
+            }
+        ),
+    )
+
+    async def async_export_records(call):
+        """Write the stored records of a lock to a json file."""
+        _lock_id = call.data[ATTR_LOCK_ID]
+        for api in hass.data[DOMAIN].values():
+            if api.has_lock(_lock_id):
+                break
+        else:
+            _LOGGER.error("Unknown TTlock lock %s", _lock_id)
+            return
+
+        _end = int(time.time() * 1000)
+        _records = await hass.async_add_executor_job(
+            api.records.query,
+            _lock_id,
+            _end - call.data[ATTR_HOURS] * 3600 * 1000,
+            _end + 1,
+        )
+        _filename = hass.config.path(f"{DOMAIN}_records_{_lock_id}.json")
+        await hass.async_add_executor_job(save_json_atomic, _filename, _records)
+        _LOGGER.info("TTlock lock records written to %s", _filename)
+
+    if config[DOMAIN].get(CONF_RECORDS):
+        hass.services.async_register(
+            DOMAIN,
+            SERVICE_EXPORT_RECORDS,
+            async_export_records,
+            schema=vol.Schema(
+                {
+                    vol.Required(ATTR_LOCK_ID): cv.positive_int,
+                    vol.Optional(ATTR_HOURS, default=24): cv.positive_int,
+                }
+            ),
+        )
+
     return True
 
 
+async def _async_setup_account(hass, api, coordinator):
+    """Load the snapshot and the token of an account, return False on failure."""
+
+    async def async_first_refresh():
+        # Check the token validated
+        try:
+            await api.token.async_load()
+        except Exception as error:
+            _LOGGER.error(
+                "Unable to validate the TTlock token of %s: %s", api.name, repr(error)
+            )
+            return False
+
+        await coordinator.async_refresh()
+        return True
+
+    # Entities are created from the last snapshot right away when there is
+    # one, the first refresh then reconciles it in the background.
+    if await api.async_load_snapshot():
+        coordinator.async_notify_changes()
+        hass.async_create_task(async_first_refresh())
+        return True
+    return await async_first_refresh()
+
+
+def build_request_scheduler(conf):
+    """Return the request scheduler shared by the accounts."""
+    return RequestScheduler(
+        conf.get(CONF_MAX_REQUESTS_PER_SECOND),
+        conf.get(CONF_REQUEST_BURST),
+        conf.get(CONF_MAX_CONCURRENT_REQUESTS),
+        conf.get(CONF_MAX_RETRIES),
+        RETRY_BACKOFF_BASE,
+        RETRY_BACKOFF_MAX,
+        CIRCUIT_BREAKER_THRESHOLD,
+        CIRCUIT_BREAKER_RESET_TIMEOUT,
+    )
+
+
 class TTlock:
-    """This class handle communication with the TTlock API."""
+    """This class handle communication with the TTlock API for one account."""
 
-    def __init__(self, hass, config):
+    def __init__(self, hass, config, account, scheduler):
         """Initialize the class."""
         # Get "global" configuration.
         self._hass = hass
-        self.client_id = config[DOMAIN].get(CONF_CLIENT_ID)
-        self.client_secret = config[DOMAIN].get(CONF_CLIENT_SECRET)
-        self.access_token = config[DOMAIN].get(CONF_ACCESS_TOKEN)
-        self.refresh_token = config[DOMAIN].get(CONF_REFRESH_TOKEN)
+        self.name = account[CONF_NAME]
+        self.client_id = account[CONF_CLIENT_ID]
+        self.client_secret = account[CONF_CLIENT_SECRET]
         self.api_uri = config[DOMAIN].get(CONF_API_URI)
         self.api_oauth_resource = config[DOMAIN].get(CONF_API_OAUTH_RESOURCE)
         self.api_gateway_resource = config[DOMAIN].get(CONF_API_GATEWAY_RESOURCE)
@@ -136,212 +529,738 @@ class TTlock:
         self.api_gateway_locks_resource = config[DOMAIN].get(
             CONF_API_GATEWAY_LOCKS_RESOURCE
         )
+        self.api_lock_list_resource = config[DOMAIN].get(CONF_API_LOCK_LIST_RESOURCE)
+        self.api_lock_resource = config[DOMAIN].get(CONF_API_LOCK_RESOURCE)
+        self.api_unlock_resource = config[DOMAIN].get(CONF_API_UNLOCK_RESOURCE)
+        self.api_lock_records_resource = config[DOMAIN].get(
+            CONF_API_LOCK_RECORDS_RESOURCE
+        )
         self._scan_interval = config[DOMAIN].get(CONF_SCAN_INTERVAL)
+        self._gateway_page_size = config[DOMAIN].get(CONF_GATEWAY_PAGE_SIZE)
+        self._gateway_prefetch = config[DOMAIN].get(CONF_GATEWAY_PREFETCH)
+        self._battery_batch = config[DOMAIN].get(CONF_BATTERY_BATCH)
+        self._lock_page_size = config[DOMAIN].get(CONF_LOCK_PAGE_SIZE)
+        # Records synced to the cloud late are fetched again within this
+        # window, in milliseconds, before the cursor.
+        self._records_lookback = int(
+            config[DOMAIN].get(CONF_RECORDS_LOOKBACK).total_seconds() * 1000
+        )
+        self._request_timeout = aiohttp.ClientTimeout(
+            total=config[DOMAIN].get(CONF_REQUEST_TIMEOUT).total_seconds()
+        )
+        self.metrics = TTlockMetrics()
+        self._scheduler = scheduler
+        # Commands skip the queue, then open states are served first when the
+        # request budget is short.
+        self._priorities = {
+            self.api_lock_resource: PRIORITY_COMMAND,
+            self.api_unlock_resource: PRIORITY_COMMAND,
+            self.api_query_lock_open_state_resource: PRIORITY_OPEN_STATE,
+            self.api_gateway_resource: PRIORITY_TOPOLOGY,
+            self.api_gateway_locks_resource: PRIORITY_TOPOLOGY,
+            self.api_query_lock_eletric_quantity_resource: PRIORITY_ELECTRIC_QUANTITY,
+            self.api_lock_list_resource: PRIORITY_ELECTRIC_QUANTITY,
+            self.api_lock_records_resource: PRIORITY_RECORDS,
+        }
+        # Response cache, resource -> TTL in seconds of its responses.
+        self._cache = TTLCache(config[DOMAIN].get(CONF_CACHE_MAX_SIZE))
+        self._cache_ttl = {
+            config[DOMAIN].get(_key): _ttl.total_seconds()
+            for _key, _ttl in {
+                **DEFAULT_CACHE_TTL,
+                **config[DOMAIN].get(CONF_CACHE_TTL),
+            }.items()
+            if _ttl.total_seconds() > 0
+        }
+        self.topology_invalidated = False
+        # Home Assistant shared session: one keep-alive connection pool for
+        # every request this integration sends.
+        self._session = async_get_clientsession(hass)
         self.redirect_url = f"{hass.config.api.base_url}/"
-        self.full_path_token_file = f"{hass.config.path()}/custom_components/{DOMAIN}/{config[DOMAIN].get(CONF_TOKEN_FILENAME)}"
-        self.gateways = []
-        self.locks = []
+        self.full_path_token_file = f"{hass.config.path()}/custom_components/{DOMAIN}/{account[CONF_TOKEN_FILENAME]}"
+        self.full_path_snapshot_file = f"{hass.config.path()}/custom_components/{DOMAIN}/{account[CONF_SNAPSHOT_FILENAME]}"
+        self.full_path_records_file = f"{hass.config.path()}/custom_components/{DOMAIN}/{account[CONF_RECORDS_FILENAME]}"
+        # Local store of the lock records, when they are ingested.
+        self.records = (
+            TTlockRecordStore(self.full_path_records_file)
+            if config[DOMAIN].get(CONF_RECORDS)
+            else None
+        )
+        self.token = TTlockTokenManager(
+            hass,
+            self,
+            self.full_path_token_file,
+            account[CONF_ACCESS_TOKEN],
+            account[CONF_REFRESH_TOKEN],
+        )
+        # Registry: gatewayId -> Gateway, and lockId -> LockState.
+        self.gateways = {}
+        self._locks = {}
+        self._removed_locks = set()
+        # lockId of the locks whose last record ingestion failed or was late.
+        self._records_late = set()
+
+    @property
+    def base_url(self):
+        """Return the API base url, https is used when no scheme is given."""
+        if "://" in self.api_uri:
+            return self.api_uri.rstrip("/")
+        return f"https://{self.api_uri}"
 
-    def get_locks(self, force_update=False):
+    async def async_get_locks(self, force_update=False):
         if force_update:
-            return self.update_devices()
+            await self.async_update_devices()
 
-        return self.locks
+        return self.get_locks()
+
+    def get_locks(self):
+        return list(self._locks.values())
+
+    def has_lock(self, lock_id):
+        return lock_id in self._locks
+
+    def get_lock(self, lock_id):
+        lock = self._locks.get(lock_id)
+        if lock is None and lock_id not in self._removed_locks:
+            # Unknown lock, the cached topology may be outdated.
+            self.invalidate_topology()
+        return lock
+
+    def invalidate_topology(self):
+        """Drop the cached gateway and lock lists."""
+        self._cache.invalidate(self.api_gateway_resource)
+        self._cache.invalidate(self.api_gateway_locks_resource)
+        self.topology_invalidated = True
+
+    def get_gateway_locks(self, gateway_id):
+        gateway = self.gateways.get(gateway_id)
+        if gateway is None:
+            return []
+        return [self._locks[lock_id] for lock_id in gateway.lock_ids]
 
     def get_scan_interval(self):
         return self._scan_interval
 
+    def get_diagnostics(self):
+        """Return the metrics and the state of the client, without secrets."""
+        return {
+            "metrics": self.metrics.as_dict(),
+            "gateways": len(self.gateways),
+            "locks": len(self._locks),
+            "token_expire_date": (
+                self.token.expire_date.isoformat() if self.token.expire_date else None
+            ),
+            "cached_responses": len(self._cache),
+        }
+
     async def async_update(self):
-        self.update_devices()
+        await self.async_update_devices()
 
-    def update_devices(self):
+    async def async_update_devices(self):
         """Update data."""
         # This is where the main logic to update platform data goes.
-        self.gateways = self.get_gateway_from_account()
-        self.get_locks_from_gateway()
-        self.get_locks_information()
-
-    def check_token_file(self):
-        """Token validate verify."""
-        if not os.path.exists(self.full_path_token_file):
-            _LOGGER.info("Token File ({}) not exist.".format(self.full_path_token_file))
-            self.refresh_access_token()
-        else:
-            will_expire = False
-            with open(self.full_path_token_file) as json_file:
-                data = json.load(json_file)
-                expire_date = datetime.fromtimestamp(data["expire_date"])
-                today = datetime.fromtimestamp(time.time())
-                if (expire_date - today).delta < 7:
-                    _LOGGER.info("Access token will expire soon.")
-                    will_expire = True
-            if will_expire:
-                self.refresh_access_token()
-
-    def get_gateway_from_account(self, _pageNo=1):
+        await self.async_update_topology()
+        await self.get_locks_information()
+
+    async def async_update_topology(self, deadline=None, cached=False):
+        """Update the gateways and the locks they list.
+
+        The cached gateway and lock lists are dropped first unless cached is
+        set, a retry of the failed gateway lock lists reuses the others.
+        """
+        if not cached:
+            self._cache.invalidate(self.api_gateway_resource)
+            self._cache.invalidate(self.api_gateway_locks_resource)
+        self.topology_invalidated = False
+        await self.get_locks_from_gateway(self.async_iter_gateways(), deadline)
+
+    def _time_left(self, deadline):
+        """Return the seconds left until the loop time deadline, or None."""
+        if deadline is None:
+            return None
+        return max(0, deadline - self._hass.loop.time())
+
+    async def _async_wait_isolated(self, tasks, deadline=None):
+        """Wait for tasks, a task -> item dict, until the deadline.
+
+        A failed or late task does not stop the others, late tasks are
+        cancelled. Return the items whose task failed or was late.
+        """
+        if not tasks:
+            # asyncio.wait rejects an empty set.
+            return []
+        try:
+            _done, _pending = await asyncio.wait(
+                tasks, timeout=self._time_left(deadline)
+            )
+        except BaseException:
+            for _task in tasks:
+                _task.cancel()
+            raise
+
+        _failed = []
+        for _task in _pending:
+            _task.cancel()
+            _failed.append(tasks[_task])
+        for _task in _done:
+            if _task.cancelled() or _task.exception() is not None:
+                _LOGGER.debug(
+                    "TTlock request failed: %s",
+                    "cancelled" if _task.cancelled() else repr(_task.exception()),
+                )
+                _failed.append(tasks[_task])
+        return _failed
+
+    async def _async_run_isolated(self, items, request, deadline=None):
+        """Run request(item) concurrently for each item, see _async_wait_isolated."""
+        return await self._async_wait_isolated(
+            {asyncio.ensure_future(request(item)): item for item in items}, deadline
+        )
+
+    @staticmethod
+    def _stale_first(locks, data_class):
+        """Return the locks, the ones with a stale data_class first.
+
+        The scheduler serves the requests in order, so the locks left out by
+        the deadline of a cycle are queried first in the next one.
+        """
+        return sorted(locks, key=lambda lock: data_class not in lock.stale)
+
+    @staticmethod
+    def _mark_stale(locks, failed, data_class):
+        """Flag data_class as stale in the failed locks, clear it in the others."""
+        failed = set(failed)
+        for lock in locks:
+            if lock in failed:
+                lock.stale = lock.stale | {data_class}
+            elif data_class in lock.stale:
+                lock.stale = lock.stale - {data_class}
+        if failed:
+            _LOGGER.warning(
+                "%d of %d TTlock %s refreshes failed or were late, last values kept",
+                len(failed),
+                len(locks),
+                data_class,
+            )
+
+    def _resource_params(self, access_token, params):
+        """Common parameters of the v3 resources."""
+        return {
+            "clientId": self.client_id,
+            "accessToken": access_token,
+            "date": int(time.time() * 1000),
+            **params,
+        }
+
+    async def get_gateway_from_account(self):
         """list of gateways"""
-        _url_request = "https://{}/{}?client_id={}&accessToken={}&pageNo={}&pageSize=20&date={}".format(
-            self.api_uri,
-            self.api_gateway_resource,
-            self.client_id,
-            self.access_token,
-            _pageNo,
-            time.time(),
-        )
-        _response = self.send_resources_request(_url_request).json()
-
-        if len(_response["list"]) == 0:
-            return _response["list"]
-        else:
-            return _response["list"] + self.get_gateway_from_account(
-                _pageNo=_pageNo + 1
+        return [gateway async for gateway in self.async_iter_gateways()]
+
+    async def async_iter_gateways(self):
+        """Yield the gateways of the account as their page is received."""
+        async for gateway in self._async_iter_pages(
+            self.api_gateway_resource, self._gateway_page_size, self._gateway_prefetch
+        ):
+            yield Gateway.from_json(gateway)
+
+    async def _async_iter_pages(
+        self, _resource, _page_size, _prefetch=False, _params=None
+    ):
+        """Yield the items of a paginated resource as their page is received.
+
+        With prefetch enabled the next page is requested while the current
+        one is consumed.
+        """
+        _params = _params or {}
+        _page_no = 1
+        _next_page = asyncio.ensure_future(
+            self._get_page(_resource, _page_no, _page_size, _params)
+        )
+        try:
+            while True:
+                _response = await _next_page
+                _next_page = None
+                _items = _response["list"]
+                if "pages" in _response:
+                    _has_next = _page_no < _response["pages"]
+                else:
+                    _has_next = len(_items) >= _page_size
+
+                if _has_next and _prefetch:
+                    _next_page = asyncio.ensure_future(
+                        self._get_page(_resource, _page_no + 1, _page_size, _params)
+                    )
+
+                for item in _items:
+                    yield item
+
+                if not _has_next:
+                    return
+
+                _page_no += 1
+                if _next_page is None:
+                    _next_page = asyncio.ensure_future(
+                        self._get_page(_resource, _page_no, _page_size, _params)
+                    )
+        finally:
+            if _next_page is not None:
+                _next_page.cancel()
+
+    async def _get_page(self, _resource, _page_no, _page_size, _params):
+        return await self.send_resources_request(
+            _resource, dict(pageNo=_page_no, pageSize=_page_size, **_params)
+        )
+
+    async def get_locks_from_gateway(self, gateways, deadline=None):
+        """list of locks
+
+        ``gateways`` is an async iterable, the locks of a gateway are
+        requested as soon as the gateway is received. The gateway list must
+        be complete by the deadline, a gateway whose lock list fails or is
+        late keeps its last good one.
+        """
+        _requests = {}
+
+        async def _async_list_gateways():
+            async for gateway in gateways:
+                _requests[
+                    asyncio.ensure_future(
+                        self.send_resources_request(
+                            self.api_gateway_locks_resource,
+                            dict(gatewayId=gateway.gateway_id),
+                        )
+                    )
+                ] = gateway
+
+        try:
+            await asyncio.wait_for(_async_list_gateways(), self._time_left(deadline))
+        except BaseException:
+            for _request in _requests:
+                _request.cancel()
+            raise
+
+        _failed = set(await self._async_wait_isolated(_requests, deadline))
+        if _failed:
+            _LOGGER.warning(
+                "%d of %d TTlock gateway lock lists failed or were late, "
+                "last lists kept",
+                len(_failed),
+                len(_requests),
+            )
+            # Requested again on the next tick.
+            self.topology_invalidated = True
+        self._update_lock_registry(
+            (gateway, None if gateway in _failed else _request.result()["list"])
+            for _request, gateway in _requests.items()
+        )
+
+    async def async_load_snapshot(self):
+        """Fill the registry from the snapshot file, return True if it existed."""
+        try:
+            data = await self._hass.async_add_executor_job(
+                load_json, self.full_path_snapshot_file
             )
+        except (OSError, ValueError) as error:
+            _LOGGER.warning("Unable to read the TTlock snapshot: %s", repr(error))
+            return False
+        if not data:
+            return False
 
-    def get_locks_from_gateway(self):
-        """list of locks"""
-        _locks = []
-        for gateway in self.gateways:
-            _url_request = "https://{}/{}?clientId={}&accessToken={}&gatewayId={}&date={}".format(
-                self.api_uri,
-                self.api_gateway_locks_resource,
-                self.client_id,
-                self.access_token,
-                gateway["gatewayId"],
-                time.time(),
+        self._update_lock_registry(
+            (
+                Gateway(_gateway_id),
+                [data["locks"][str(_lock_id)] for _lock_id in _lock_ids],
             )
-            _request = self.send_resources_request(_url_request)
-            _locks = _locks + [(gateway["gatewayId"], _request.json()["list"])]
-
-        self.lock = _locks
-
-    def get_locks_information(self):
-        for locks_per_gateway in self.locks:
-            for lock in locks_per_gateway[1]:
-                _url_request = "https://{}/{}?clientId={}&accessToken={}&lockId={}&date={}".format(
-                    self.api_uri,
-                    self.api_query_lock_eletric_quantity_resource,
-                    self.client_id,
-                    self.access_token,
-                    lock["lockId"],
-                    time.time(),
+            for _gateway_id, _lock_ids in data["gateways"]
+        )
+        return True
+
+    async def async_save_snapshot(self):
+        """Write the topology and the lock values to the snapshot file."""
+        data = {
+            "gateways": [
+                (gateway.gateway_id, gateway.lock_ids)
+                for gateway in self.gateways.values()
+            ],
+            "locks": {
+                _lock_id: lock.as_json() for _lock_id, lock in self._locks.items()
+            },
+        }
+        await self._hass.async_add_executor_job(
+            save_json_atomic, self.full_path_snapshot_file, data
+        )
+
+    def _update_lock_registry(self, locks_per_gateway):
+        """Merge the listed locks, (Gateway, listLock items) pairs, into the registry.
+
+        Known locks are updated in place so references held elsewhere stay
+        valid, locks no gateway reports anymore are dropped. A gateway with
+        None as items keeps its previous locks, flagged with a stale topology
+        unless another gateway lists them.
+        """
+        _gateways = {}
+        # Lock ids kept from failed gateways, and reported by the others.
+        _unlisted = set()
+        _reported = set()
+        for gateway, _locks in locks_per_gateway:
+            gateway = _gateways.setdefault(gateway.gateway_id, gateway)
+            if _locks is None:
+                _previous = self.gateways.get(gateway.gateway_id)
+                if _previous is not None:
+                    gateway.lock_ids.extend(
+                        _lock_id
+                        for _lock_id in _previous.lock_ids
+                        if _lock_id not in gateway.lock_ids
+                    )
+                    _unlisted.update(_previous.lock_ids)
+                continue
+            _reported.update(lock["lockId"] for lock in _locks)
+            for lock in _locks:
+                _lock_id = lock["lockId"]
+                if _lock_id in self._locks:
+                    self._locks[_lock_id].update(lock)
+                else:
+                    self._locks[_lock_id] = LockState.from_json(lock)
+                if _lock_id not in gateway.lock_ids:
+                    gateway.lock_ids.append(_lock_id)
+
+        _listed = {
+            _lock_id for gateway in _gateways.values() for _lock_id in gateway.lock_ids
+        }
+        for _lock_id in set(self._locks) - _listed:
+            del self._locks[_lock_id]
+            self._removed_locks.add(_lock_id)
+        self._removed_locks -= _listed
+        self.gateways = _gateways
+
+        _unlisted -= _reported
+        for _lock_id, lock in self._locks.items():
+            if _lock_id in _unlisted:
+                lock.stale = lock.stale | {REFRESH_TOPOLOGY}
+            elif REFRESH_TOPOLOGY in lock.stale:
+                lock.stale = lock.stale - {REFRESH_TOPOLOGY}
+
+    async def get_locks_information(self, locks=None, deadline=None):
+        """Query battery and open state of the locks concurrently."""
+        await asyncio.gather(
+            self.get_locks_electric_quantity(locks, deadline),
+            self.get_locks_open_state(locks, deadline),
+        )
+
+    async def get_locks_electric_quantity(self, locks=None, deadline=None):
+        """Update the battery levels, from the account lock list when batched.
+
+        The locks the list does not give the battery level of are queried one
+        by one. Locks whose query fails or is late are marked stale.
+        """
+        if locks is None:
+            locks = list(self._locks.values())
+        _remaining = locks
+        if self._battery_batch and locks:
+            try:
+                _remaining = await asyncio.wait_for(
+                    self._update_from_lock_list(locks), self._time_left(deadline)
                 )
-                _request = self.send_resources_request(_url_request)
-                lock["electricQuantity"] = _request.json()["electricQuantity"]
-
-                _url_request = "https://{}/{}?clientId={}&accessToken={}&lockId={}&date={}".format(
-                    self.api_uri,
-                    self.api_query_lock_open_state_resource,
-                    self.client_id,
-                    self.access_token,
-                    lock["lockId"],
-                    time.time(),
+            except (asyncio.TimeoutError, TTlockError) as error:
+                _LOGGER.warning(
+                    "Unable to list the TTlock locks, querying them one by one: %s",
+                    repr(error),
                 )
-                _request = self.send_resources_request(_url_request)
-                lock["state"] = _request.json()["state"]
+        _failed = await self._async_run_isolated(
+            self._stale_first(_remaining, REFRESH_ELECTRIC_QUANTITY),
+            self.get_lock_electric_quantity,
+            deadline,
+        )
+        self._mark_stale(locks, _failed, REFRESH_ELECTRIC_QUANTITY)
 
-    def send_resources_request(self, _url_request):
-        try:
-            return self.send_request(_url_request)
-        except PermissionError as error:
-            _LOGGER.info(repr(error))
-            self.refresh_access_token()
+    async def _update_from_lock_list(self, locks):
+        """Update locks from the v3/lock/list pages, return the locks not updated.
 
-    def refresh_access_token(self):
-        """if token will expire, refresh"""
-        _LOGGER.info("Generating a new Access token.")
-        _url_request = "https://{}/{}?client_id={}&client_secret={}&grant_type=refresh_token&refresh_token={}&redirect_uri={}".format(
-            self.api_uri,
-            self.api_oauth_resource,
-            self.client_id,
-            self.client_secret,
-            self.refresh_token,
-            self.redirect_url,
+        Paging stops once every lock has been updated.
+        """
+        _pending = {lock.lock_id: lock for lock in locks}
+        async for item in self._async_iter_pages(
+            self.api_lock_list_resource, self._lock_page_size
+        ):
+            lock = _pending.get(item["lockId"])
+            if lock is None:
+                continue
+            lock.update(item)
+            if "electricQuantity" in item:
+                del _pending[item["lockId"]]
+                if not _pending:
+                    break
+        return list(_pending.values())
+
+    async def get_locks_open_state(self, locks=None, deadline=None):
+        """Update the open states, locks whose query fails or is late are stale."""
+        if locks is None:
+            locks = list(self._locks.values())
+        _failed = await self._async_run_isolated(
+            self._stale_first(locks, REFRESH_OPEN_STATE),
+            self.get_lock_open_state,
+            deadline,
+        )
+        self._mark_stale(locks, _failed, REFRESH_OPEN_STATE)
+
+    async def get_lock_electric_quantity(self, lock):
+        _response = await self.send_resources_request(
+            self.api_query_lock_eletric_quantity_resource,
+            dict(lockId=lock.lock_id),
+        )
+        lock.electric_quantity = _response["electricQuantity"]
+
+    async def get_lock_open_state(self, lock):
+        _response = await self.send_resources_request(
+            self.api_query_lock_open_state_resource,
+            dict(lockId=lock.lock_id),
         )
+        lock.state = _response["state"]
 
-        _response = self.send_request(_url_request)
+    async def async_ingest_records(self, locks=None, deadline=None):
+        """Store the new records of the locks, fetched from their cursor.
 
-        self.access_token = _response["access_token"]
-        self.refresh_token = _response["refresh_token"]
-        _expire_date = datetime.fromtimestamp(
-            time.time() + (_response["expires_in"] * 1000)
+        Return the count of new records. The locks whose ingestion fails or
+        is late are ingested again from their cursor, first, next time.
+        """
+        if locks is None:
+            locks = list(self._locks.values())
+        _counts = []
+
+        async def _async_ingest(lock):
+            _counts.append(await self._async_ingest_lock_records(lock))
+
+        _failed = await self._async_run_isolated(
+            sorted(locks, key=lambda lock: lock.lock_id not in self._records_late),
+            _async_ingest,
+            deadline,
+        )
+        self._records_late = (
+            self._records_late - {lock.lock_id for lock in locks}
+        ) | {lock.lock_id for lock in _failed}
+        if _failed:
+            _LOGGER.warning(
+                "%d of %d TTlock lock record ingestions failed or were late",
+                len(_failed),
+                len(locks),
+            )
+        return sum(_counts)
+
+    async def _async_ingest_lock_records(self, lock):
+        """Stream the new records of a lock to the store, page by page.
+
+        The cursor moves once every page is stored, an interrupted ingestion
+        fetches the same records again next time.
+        """
+        _cursor = await self._hass.async_add_executor_job(
+            self.records.cursor, lock.lock_id
         )
-        _response["expire_date"] = _expire_date
+        _count = 0
+        _newest = None
+        _page = []
+        async for record in self._async_iter_pages(
+            self.api_lock_records_resource,
+            RECORDS_PAGE_SIZE,
+            _params=dict(
+                lockId=lock.lock_id,
+                # The lockDate of a record synced late is before the cursor,
+                # the records already stored are ignored.
+                startDate=max(0, _cursor - self._records_lookback)
+                if _cursor is not None
+                else 0,
+                endDate=0,
+            ),
+        ):
+            _page.append(record)
+            _newest = max(_newest or 0, record["lockDate"])
+            if len(_page) >= RECORDS_PAGE_SIZE:
+                _count += await self._hass.async_add_executor_job(
+                    self.records.append, lock.lock_id, _page
+                )
+                _page = []
+        if _page:
+            _count += await self._hass.async_add_executor_job(
+                self.records.append, lock.lock_id, _page
+            )
+        if _newest is not None:
+            await self._hass.async_add_executor_job(
+                self.records.move_cursor, lock.lock_id, _newest
+            )
+        return _count
+
+    async def async_lock(self, lock):
+        """Lock a lock remotely, through its gateway."""
+        await self._send_command(self.api_lock_resource, lock)
+
+    async def async_unlock(self, lock):
+        """Unlock a lock remotely, through its gateway."""
+        await self._send_command(self.api_unlock_resource, lock)
+
+    async def _send_command(self, _resource, lock):
+        await self._send_resources_request(_resource, dict(lockId=lock.lock_id))
+        # The cached open states are outdated.
+        self._cache.invalidate(self.api_query_lock_open_state_resource)
 
+    async def async_warm_up(self):
+        """Open a pooled connection to the API ahead of the commands."""
         try:
-            os.remove(self.full_path_token_file)
-        except:
-            _LOGGER.info("Error while deleting Token file")
+            async with self._session.head(self.base_url, timeout=self._request_timeout):
+                pass
+        except (asyncio.TimeoutError, aiohttp.ClientError) as error:
+            _LOGGER.debug("Unable to warm up the TTlock connection: %s", repr(error))
 
-        with open(self.full_path_token_file, "w") as outfile:
-            json.dump(_response, outfile)
+    async def send_resources_request(self, _resource, _params):
+        """Send a resource request, answered from the cache when possible."""
+        _ttl = self._cache_ttl.get(_resource)
+        if _ttl is None:
+            return await self._send_resources_request(_resource, _params)
 
-    def send_request(self, _url_request):
+        _key = self._cache.key(_resource, _params)
+        _response = self._cache.get(_key)
+        if _response is None:
+            _response = await self._send_resources_request(_resource, _params)
+            self._cache.set(_key, _response, _ttl)
+        return _response
+
+    async def _send_resources_request(self, _resource, _params):
+        """Send a resource request, retried once with a new token if it expired."""
+        _access_token = self.token.access_token
+        try:
+            return await self.send_request(
+                _resource, self._resource_params(_access_token, _params)
+            )
+        except TTlockTokenError as error:
+            _LOGGER.info(repr(error))
+            await self.token.async_refresh(_access_token)
+
+        return await self.send_request(
+            _resource, self._resource_params(self.token.access_token, _params)
+        )
+
+    async def request_access_token(self, refresh_token):
+        """Exchange the refresh token for a new access token."""
+        return await self.send_request(
+            self.api_oauth_resource,
+            {
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "grant_type": "refresh_token",
+                "refresh_token": refresh_token,
+                "redirect_uri": self.redirect_url,
+            },
+        )
+
+    async def send_request(self, _resource, _params):
+        """Post to a TTlock resource through the request scheduler."""
+        return await self._scheduler.async_run(
+            _resource,
+            lambda: self._post(_resource, _params),
+            self._priorities.get(_resource, PRIORITY_DEFAULT),
+            self.name,
+            self.metrics,
+        )
+
+    async def _post(self, _resource, _params):
+        """Post to a TTlock resource and return the decoded response body."""
         from integrationhelper.const import GOOD_HTTP_CODES
 
-        TOKEN_ERROR_CODES = [10003]
         _headers = {"Content-Type": "application/x-www-form-urlencoded"}
-        _request = requests.post(_url_request, headers=_headers)
-        if _request.status_code not in GOOD_HTTP_CODES:
-            raise Exception("HTTP_ERROR", _request.status_code)
-        else:
-            if _request.json()["errcode"]:
-                if _request.json()["errcode"] in TOKEN_ERROR_CODES:
-                    raise PermissionError("API_TOKEN_ERROR", _request.json()["errcode"])
+        _url_request = "{}/{}".format(self.base_url, _resource)
+        _start = time.monotonic()
+        try:
+            async with self._session.post(
+                _url_request,
+                data=_params,
+                headers=_headers,
+                timeout=self._request_timeout,
+            ) as _request:
+                if _request.status not in GOOD_HTTP_CODES:
+                    raise TTlockHttpError(_request.status)
+                # Decode the body once, the API does not always answer with
+                # an application/json content type.
+                _response = await _request.json(content_type=None)
+
+            _errcode = _response.get("errcode")
+            if _errcode:
+                if _errcode in TOKEN_ERROR_CODES:
+                    raise TTlockTokenError(_errcode, _response.get("errmsg"))
                 else:
-                    raise Exception("API_ERROR", _request.json()["errcode"])
+                    raise TTlockApiError(_errcode, _response.get("errmsg"))
+        except (asyncio.TimeoutError, aiohttp.ClientError) as error:
+            self.metrics.record_request(_resource, time.monotonic() - _start, error)
+            raise TTlockHttpError(None, repr(error))
+        except TTlockError as error:
+            self.metrics.record_request(_resource, time.monotonic() - _start, error)
+            raise
 
-        return _request.json()
+        self.metrics.record_request(_resource, time.monotonic() - _start)
+        return _response
 
 
 class TTLockDevice(Entity):
     """Representation of a TTLock device"""
 
-    def __init__(self, hass, lock):
+    def __init__(self, hass, api, lock):
         """Initialize the device."""
 
         self._sensor = None
         self._state = None
         self._hass = hass
-        self._lockid = lock["lockId"]
-        self._rssi = lock["rssi"]
+        self._api = api
+        self._lockid = lock.lock_id
+        self._rssi = lock.rssi
 
         self._attributes = {
             "lock_id": self._lockid,
         }
+        self._remove_signal_update = None
 
-    def get_lock(self):
-        for lock in self._hass.data[DOMAIN].get_locks():
-            if "lockId" in lock and lock["lockId"] == self._lockid:
-                return lock
+    async def async_added_to_hass(self):
+        """Subscribe to the updates of the lock."""
+        self._remove_signal_update = async_dispatcher_connect(
+            self._hass,
+            SIGNAL_LOCK_UPDATED.format(self._api.name, self._lockid),
+            self._update_callback,
+        )
 
-        return None
+    async def async_will_remove_from_hass(self):
+        """Unsubscribe from the updates of the lock."""
+        if self._remove_signal_update is not None:
+            self._remove_signal_update()
+            self._remove_signal_update = None
+
+    @callback
+    def _update_callback(self):
+        """Write the new state of the lock, within the notification."""
+        self.get_state()
+        self.async_write_ha_state()
+
+    def get_lock(self):
+        return self._api.get_lock(self._lockid)
 
     def get_state(self):
         lock = self.get_lock()
 
         # Lock:
-        if "electricQuantity" in lock:
-            self._attributes["electricQuantity"] = lock["electricQuantity"]
+        if lock and lock.electric_quantity is not None:
+            self._attributes["electricQuantity"] = lock.electric_quantity
+        if lock:
+            self._attributes["stale"] = sorted(lock.stale)
 
     def get_available(self):
         lock = self.get_lock()
-        return lock["rssi"] if lock else False
+        return lock.rssi if lock else False
 
     @property
     def should_poll(self):
-        """Return the polling state."""
-        return True
+        """Return the polling state, updates are pushed by the coordinator."""
+        return False
 
     @property
     def available(self):
         """Return true if device is online."""
         return self.get_available()
 
-    def update(self):
-        """Update device state."""
-        # we don't update here because there's 1 single thread that can be active at anytime
-        pass
-
     @property
     def device_state_attributes(self):
         """Return device specific state attributes."""
@@ -0,0 +1,147 @@
+"""Access token management for ttlock."""
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_point_in_utc_time
+import homeassistant.util.dt as dt_util
+
+from .const import TOKEN_REFRESH_MARGIN, TOKEN_REFRESH_RETRY
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def save_json_atomic(filename, data):
+    """Write data as json to filename, readers never see a partial file."""
+    _tmp_filename = f"{filename}.tmp"
+    with open(_tmp_filename, "w") as outfile:
+        json.dump(data, outfile, separators=(",", ":"))
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(_tmp_filename, filename)
+
+
+def load_json(filename):
+    """Return the json content of filename, None if it does not exist."""
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as json_file:
+        return json.load(json_file)
+
+
+class TTlockTokenManager:
+    """Keep the TTlock access token in memory and refresh it ahead of expiry.
+
+    Concurrent callers share a single in-flight refresh.
+    """
+
+    def __init__(self, hass, api, filename, access_token, refresh_token):
+        """Initialize the token manager."""
+        self._hass = hass
+        self._api = api
+        self._filename = filename
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expire_date = None
+        self._refresh_task = None
+        self._unsub_scheduled_refresh = None
+
+    async def async_load(self):
+        """Load the token file once and refresh the token if needed."""
+        data = await self._hass.async_add_executor_job(load_json, self._filename)
+        if data is None:
+            _LOGGER.info("Token File ({}) not exist.".format(self._filename))
+            await self.async_refresh()
+            return
+
+        self.access_token = data["access_token"]
+        self.refresh_token = data["refresh_token"]
+        self.expire_date = dt_util.utc_from_timestamp(data["expire_date"])
+        _refresh_date = self._refresh_date(data.get("expires_in"))
+        if _refresh_date <= dt_util.utcnow():
+            _LOGGER.info("Access token will expire soon.")
+            await self.async_refresh()
+        else:
+            self._schedule_refresh(_refresh_date)
+
+    async def async_refresh(self, expired_token=None):
+        """Refresh the access token.
+
+        ``expired_token`` is the token a failed request was sent with, no new
+        refresh is done when it was already replaced.
+        """
+        if expired_token is not None and expired_token != self.access_token:
+            return
+
+        if self._refresh_task is None:
+            self._refresh_task = self._hass.async_create_task(self._async_refresh())
+        _refresh_task = self._refresh_task
+        # Shielded so a cancelled caller does not cancel the shared refresh.
+        await asyncio.shield(_refresh_task)
+
+    async def _async_refresh(self):
+        _LOGGER.info("Generating a new Access token.")
+        try:
+            _response = await self._api.request_access_token(self.refresh_token)
+
+            self._api.metrics.record_token_refresh()
+            self.access_token = _response["access_token"]
+            self.refresh_token = _response["refresh_token"]
+            _response["expire_date"] = time.time() + _response["expires_in"]
+            self.expire_date = dt_util.utcnow() + timedelta(
+                seconds=_response["expires_in"]
+            )
+
+            await self._hass.async_add_executor_job(
+                save_json_atomic, self._filename, _response
+            )
+        finally:
+            self._refresh_task = None
+
+        # Never in the past, a short lived token would be refreshed in a loop.
+        self._schedule_refresh(
+            max(
+                dt_util.utcnow() + TOKEN_REFRESH_RETRY,
+                self._refresh_date(_response["expires_in"]),
+            )
+        )
+
+    def _refresh_date(self, expires_in):
+        """Return when to refresh the token, of expires_in seconds of lifetime.
+
+        The margin before expiry is at most half the lifetime.
+        """
+        _margin = TOKEN_REFRESH_MARGIN
+        if expires_in is not None:
+            _margin = min(_margin, timedelta(seconds=expires_in) / 2)
+        return self.expire_date - _margin
+
+    def _schedule_refresh(self, point_in_time):
+        if self._unsub_scheduled_refresh is not None:
+            self._unsub_scheduled_refresh()
+        self._unsub_scheduled_refresh = async_track_point_in_utc_time(
+            self._hass, self._scheduled_refresh, point_in_time
+        )
+
+    @callback
+    def _scheduled_refresh(self, now):
+        self._unsub_scheduled_refresh = None
+        self._hass.async_create_task(self._async_scheduled_refresh())
+
+    async def _async_scheduled_refresh(self):
+        try:
+            await self.async_refresh()
+        except Exception as error:
+            _LOGGER.error("Unable to refresh the TTlock token: %s", repr(error))
+            self._schedule_refresh(dt_util.utcnow() + TOKEN_REFRESH_RETRY)
+
+    @callback
+    def async_stop(self):
+        """Cancel the scheduled refresh."""
+        if self._unsub_scheduled_refresh is not None:
+            self._unsub_scheduled_refresh()
+            self._unsub_scheduled_refresh = None
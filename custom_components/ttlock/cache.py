@@ -0,0 +1,64 @@
+"""Response cache for ttlock."""
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Size bounded cache whose entries expire after a per entry TTL.
+
+    Keys are ``(resource, params)`` tuples so the entries of a resource can
+    be invalidated together. The least recently used entry is evicted when
+    the cache is full.
+    """
+
+    def __init__(self, max_size):
+        """Initialize the cache."""
+        self._max_size = max_size
+        # key -> (expire time, value), in least recently used order.
+        self._entries = OrderedDict()
+        # resource -> keys of its entries.
+        self._resource_keys = {}
+
+    @staticmethod
+    def key(resource, params):
+        """Return the cache key of a request."""
+        return (resource, tuple(sorted(params.items())))
+
+    def get(self, key):
+        """Return the cached value, None when missing or expired."""
+        _entry = self._entries.get(key)
+        if _entry is None:
+            return None
+        if _entry[0] <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return _entry[1]
+
+    def set(self, key, value, ttl):
+        """Cache value for ttl seconds."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._resource_keys.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self._max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, resource=None):
+        """Drop the entries of resource, or every entry."""
+        if resource is None:
+            self._entries.clear()
+            self._resource_keys.clear()
+            return
+        for key in self._resource_keys.pop(resource, ()):
+            del self._entries[key]
+
+    def _remove(self, key):
+        del self._entries[key]
+        _keys = self._resource_keys[key[0]]
+        _keys.discard(key)
+        if not _keys:
+            del self._resource_keys[key[0]]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,94 @@
+"""Lock event callback view for ttlock."""
+import hmac
+import json
+import logging
+import secrets
+
+from aiohttp import web
+
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.const import HTTP_BAD_REQUEST, HTTP_NOT_FOUND
+
+from .auth import load_json, save_json_atomic
+from .const import (
+    CALLBACK_NAME,
+    CALLBACK_URL,
+    LOCK_RECORD_TYPES,
+    LOCK_STATE_LOCKED,
+    LOCK_STATE_UNLOCKED,
+    UNLOCK_RECORD_TYPES,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def load_callback_secret(filename):
+    """Return the secret of the callback URL, generated and saved on first use."""
+    _data = load_json(filename)
+    if _data and _data.get("secret"):
+        return _data["secret"]
+    _secret = secrets.token_urlsafe(24)
+    save_json_atomic(filename, {"secret": _secret})
+    return _secret
+
+
+def parse_records(lock_id, records):
+    """Return the LockState values, per lockId, set by the callback records.
+
+    Records are applied in lock time order so the last event wins.
+    """
+    _values = {}
+    for record in sorted(records, key=lambda record: record.get("lockDate", 0)):
+        _lock_values = _values.setdefault(int(record.get("lockId", lock_id)), {})
+        _record_type = record.get("recordType") if record.get("success", 1) else None
+        if _record_type in UNLOCK_RECORD_TYPES:
+            _lock_values["state"] = LOCK_STATE_UNLOCKED
+        elif _record_type in LOCK_RECORD_TYPES:
+            _lock_values["state"] = LOCK_STATE_LOCKED
+        if record.get("electricQuantity", -1) >= 0:
+            _lock_values["electric_quantity"] = record["electricQuantity"]
+    return _values
+
+
+class TTlockCallbackView(HomeAssistantView):
+    """Receive the lock records the TTlock cloud posts to the callback URL.
+
+    The TTlock cloud cannot authenticate, so the URL holds a secret: posts
+    to another URL, or with the clientId of another application, are
+    rejected. Events of unknown locks are ignored.
+    """
+
+    url = CALLBACK_URL
+    name = CALLBACK_NAME
+    requires_auth = False
+
+    def __init__(self, coordinators, secret, client_ids):
+        """Initialize the view with the coordinators of the accounts."""
+        self._coordinators = coordinators
+        self._secret = secret
+        self._client_ids = client_ids
+
+    async def post(self, request, secret):
+        """Handle a callback, TTlock expects "success" in the response."""
+        if not hmac.compare_digest(secret, self._secret):
+            return self.json_message("Not found", HTTP_NOT_FOUND)
+        data = await request.post()
+        if "clientId" in data and data["clientId"] not in self._client_ids:
+            _LOGGER.debug("TTlock callback of unknown client %s", data["clientId"])
+            return self.json_message("Unknown client", HTTP_BAD_REQUEST)
+        try:
+            _values = parse_records(
+                int(data["lockId"]), json.loads(data.get("records") or "[]")
+            )
+        except (KeyError, TypeError, ValueError) as error:
+            _LOGGER.debug("Invalid TTlock callback: %s", repr(error))
+            return self.json_message("Invalid callback", HTTP_BAD_REQUEST)
+
+        for _lock_id, _lock_values in _values.items():
+            if not any(
+                coordinator.async_push(_lock_id, _lock_values)
+                for coordinator in self._coordinators.values()
+            ):
+                _LOGGER.debug("TTlock callback for unknown lock %s", _lock_id)
+
+        return web.Response(text="success")
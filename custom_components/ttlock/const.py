@@ -1,9 +1,28 @@
 """Constants for ttlock."""
+from datetime import timedelta
+
 # Base component constants
 DOMAIN = "ttlock"
 VERSION = "0.0.1"
-PLATFORMS = ["sensor"]
-REQUIRED_FILES = [".translations/en.json", "const.py", "manifest.json", "sensor.py"]
+PLATFORMS = ["sensor", "lock"]
+REQUIRED_FILES = [
+    ".translations/en.json",
+    "auth.py",
+    "cache.py",
+    "callback.py",
+    "const.py",
+    "coordinator.py",
+    "exceptions.py",
+    "lock.py",
+    "manifest.json",
+    "metrics.py",
+    "models.py",
+    "profiler.py",
+    "records.py",
+    "scheduler.py",
+    "sensor.py",
+    "services.yaml",
+]
 ISSUE_URL = "https://github.com/tonyldo/lock.ttlock/issues"
 ATTRIBUTION = "Data from this is provided by TTlock."
 
@@ -11,6 +30,8 @@ ATTRIBUTION = "Data from this is provided by TTlock."
 ICON = "mdi:zmdi-globe-lock"
 
 # Configuration
+CONF_ACCOUNT = "account"
+CONF_ACCOUNTS = "accounts"
 CONF_CLIENT_ID = "client_id"
 CONF_CLIENT_SECRET = "client_secret"
 CONF_ACCESS_TOKEN = "access_token"
@@ -21,8 +42,120 @@ CONF_API_GATEWAY_RESOURCE = "api_gateway_resource"
 CONF_API_GATEWAY_LOCKS_RESOURCE = "api_gateway_locks_resource"
 CONF_API_QUERY_OPEN_STATE_RESOURCE = "api_query_open_state_resource"
 CONF_API_QUERY_LOCK_ELETRIC_QUANTITY = "api_query_lock_eletric_quantity"
+CONF_API_LOCK_LIST_RESOURCE = "api_lock_list_resource"
+CONF_API_LOCK_RESOURCE = "api_lock_resource"
+CONF_API_UNLOCK_RESOURCE = "api_unlock_resource"
+CONF_API_LOCK_RECORDS_RESOURCE = "api_lock_records_resource"
 CONF_TOKEN_FILENAME = "token_filename"
+CONF_SNAPSHOT_FILENAME = "snapshot_filename"
+CONF_RECORDS = "records"
+CONF_RECORDS_FILENAME = "records_filename"
+CONF_RECORDS_SCAN_INTERVAL = "records_scan_interval"
+CONF_RECORDS_LOOKBACK = "records_lookback"
+CONF_TOPOLOGY_SCAN_INTERVAL = "topology_scan_interval"
+CONF_BATTERY_SCAN_INTERVAL = "battery_scan_interval"
+CONF_SCAN_JITTER = "scan_jitter"
+CONF_CALLBACK = "callback"
+CONF_PUSH_SCAN_INTERVAL = "push_scan_interval"
+CONF_STAGGERED_POLLING = "staggered_polling"
+CONF_CYCLE_TIMEOUT = "cycle_timeout"
+CONF_CACHE_TTL = "cache_ttl"
+CONF_CACHE_MAX_SIZE = "cache_max_size"
+CONF_REQUEST_TIMEOUT = "request_timeout"
+CONF_MAX_CONCURRENT_REQUESTS = "max_concurrent_requests"
+CONF_GATEWAY_PAGE_SIZE = "gateway_page_size"
+CONF_GATEWAY_PREFETCH = "gateway_prefetch"
+CONF_BATTERY_BATCH = "battery_batch"
+CONF_LOCK_PAGE_SIZE = "lock_page_size"
+CONF_MAX_REQUESTS_PER_SECOND = "max_requests_per_second"
+CONF_REQUEST_BURST = "request_burst"
+CONF_MAX_RETRIES = "max_retries"
+
+# Data
+DATA_COORDINATOR = f"{DOMAIN}_coordinator"
+DATA_SCHEDULER = f"{DOMAIN}_scheduler"
+DATA_PROFILER = f"{DOMAIN}_profiler"
+
+# Signals, formatted with the account name
+SIGNAL_LOCK_UPDATED = f"{DOMAIN}_lock_updated_{{}}_{{}}"
+SIGNAL_METRICS_UPDATED = f"{DOMAIN}_metrics_updated_{{}}"
+
+# Services
+SERVICE_DUMP_DIAGNOSTICS = "dump_diagnostics"
+SERVICE_EXPORT_RECORDS = "export_records"
+SERVICE_PROFILE = "profile"
+SERVICE_REFRESH = "refresh"
+
+# Service attributes
+ATTR_CYCLES = "cycles"
+ATTR_HOURS = "hours"
+ATTR_LOCK_ID = "lock_id"
+
+# Lock event callback, pushed events of a lock are applied together after
+# CALLBACK_DEBOUNCE seconds. The URL holds a secret kept in
+# CALLBACK_SECRET_FILENAME, next to the token files.
+CALLBACK_URL = f"/api/{DOMAIN}/callback/{{secret}}"
+CALLBACK_SECRET_FILENAME = "callback.json"
+CALLBACK_NAME = f"api:{DOMAIN}:callback"
+CALLBACK_DEBOUNCE = 1
+
+# Open states of queryOpenState, and the lock record types that set them.
+LOCK_STATE_LOCKED = 0
+LOCK_STATE_UNLOCKED = 1
+# By app, passcode, IC card, fingerprint, wristband, mechanical key,
+# gateway, from inside, unlock key.
+UNLOCK_RECORD_TYPES = (1, 4, 7, 8, 9, 10, 12, 32, 46)
+# By app, fingerprint, passcode, IC card, mechanical key, auto lock, lock key.
+LOCK_RECORD_TYPES = (11, 33, 34, 35, 36, 45, 47)
+
+# Delay, in seconds, before the open state of a lock is queried to confirm
+# the state set by a command.
+COMMAND_CONFIRM_DELAY = 2
+
+# Refreshed data classes, each one has its own scan interval.
+REFRESH_TOPOLOGY = "topology"
+REFRESH_ELECTRIC_QUANTITY = "electric_quantity"
+REFRESH_OPEN_STATE = "open_state"
+REFRESH_RECORDS = "records"
+
+# Lock records are fetched by pages of RECORDS_PAGE_SIZE.
+RECORDS_PAGE_SIZE = 100
+
+# Staggered polling: the open state scan interval is split in one slot per
+# shard of at most STAGGER_SHARD_SIZE locks of a gateway.
+STAGGER_SHARD_SIZE = 10
+STAGGER_MIN_TICK = timedelta(seconds=1)
+
+# LockState attributes whose change triggers an entity state write.
+TRACKED_LOCK_ATTRIBUTES = ("electric_quantity", "state", "rssi", "stale")
+
+# Access tokens are refreshed this long before they expire, failed
+# background refreshes are retried after TOKEN_REFRESH_RETRY.
+TOKEN_REFRESH_MARGIN = timedelta(days=7)
+TOKEN_REFRESH_RETRY = timedelta(minutes=5)
+
+# API error handling
+TOKEN_ERROR_CODES = [10003]
+# 90000: internal server error, -3003: gateway busy.
+RETRYABLE_ERRCODES = [90000, -3003]
+RETRYABLE_HTTP_CODES = [429, 500, 502, 503, 504]
+RETRY_BACKOFF_BASE = 1
+RETRY_BACKOFF_MAX = 30
+CIRCUIT_BREAKER_THRESHOLD = 5
+CIRCUIT_BREAKER_RESET_TIMEOUT = 60
 
+# Request priorities, lower values are sent first. Commands skip the queue.
+PRIORITY_COMMAND = 0
+PRIORITY_OPEN_STATE = 10
+PRIORITY_DEFAULT = 20
+PRIORITY_TOPOLOGY = 30
+PRIORITY_ELECTRIC_QUANTITY = 40
+PRIORITY_RECORDS = 50
 
 # Defaults
 DEFAULT_NAME = DOMAIN
+# The gateway and lock lists rarely change, their responses are cached.
+DEFAULT_CACHE_TTL = {
+    CONF_API_GATEWAY_RESOURCE: timedelta(hours=1),
+    CONF_API_GATEWAY_LOCKS_RESOURCE: timedelta(hours=1),
+}
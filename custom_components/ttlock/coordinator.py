@@ -0,0 +1,555 @@
+"""Update coordinator for ttlock."""
+import asyncio
+import logging
+import random
+import time
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import (
+    async_call_later,
+    async_track_point_in_utc_time,
+    async_track_time_interval,
+)
+import homeassistant.util.dt as dt_util
+
+from .const import (
+    CALLBACK_DEBOUNCE,
+    COMMAND_CONFIRM_DELAY,
+    LOCK_STATE_LOCKED,
+    LOCK_STATE_UNLOCKED,
+    REFRESH_ELECTRIC_QUANTITY,
+    REFRESH_OPEN_STATE,
+    REFRESH_RECORDS,
+    REFRESH_TOPOLOGY,
+    SIGNAL_LOCK_UPDATED,
+    SIGNAL_METRICS_UPDATED,
+    STAGGER_MIN_TICK,
+    STAGGER_SHARD_SIZE,
+    TRACKED_LOCK_ATTRIBUTES,
+)
+from .exceptions import TTlockError
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class TTlockCoordinator:
+    """Refresh the TTlock data and notify the entities of the locks that changed.
+
+    Topology, battery level and open state each have their own interval, a
+    tick only requests the data classes that are due. Cycles never overlap:
+    a tick arriving while a cycle runs is skipped, a manual refresh joins
+    the running cycle.
+
+    Locks whose events are pushed to the callback URL have their open state
+    polled every push_interval only, as a safety net.
+
+    With stagger the open state interval is split in one slot per shard of
+    the locks of a gateway, each tick polls the next shard so the requests
+    are spread over the interval. Shards are rebuilt after each topology
+    refresh.
+
+    Lock commands set the state optimistically, then the open state of the
+    lock alone is queried to confirm it. A command sent while the same one
+    is in flight for the lock joins it.
+
+    A cycle has a deadline, cycle_timeout or the shortest interval of the
+    data classes it refreshes: the requests still running then are cancelled
+    and the locks they were for keep their last values, marked stale. Locks
+    with a stale battery level are queried again with a backoff.
+    """
+
+    def __init__(
+        self,
+        hass,
+        api,
+        intervals,
+        jitter,
+        push_interval,
+        stagger=False,
+        cycle_timeout=None,
+    ):
+        """Initialize the coordinator."""
+        self._hass = hass
+        self._api = api
+        self._cycle_timeout = cycle_timeout
+        self._jitter = jitter.total_seconds()
+        self._push_interval = push_interval.total_seconds()
+        # lockId -> monotonic time its pushed open state was last confirmed.
+        self._push_locks = {}
+        # lockId -> LockState values pushed during the debounce delay.
+        self._pushed = {}
+        self._unsub_push = None
+        # lockId -> (open state set, task) of the command in flight.
+        self._commands = {}
+        self._refresh_task = None
+        self._unsub_listeners = []
+        self._unsub_tick = None
+        self._stagger = stagger
+        # Lists of the LockState polled together, and the next one to poll.
+        self._shards = []
+        self._slot = 0
+        # Data class (REFRESH_*) -> interval and time of the next refresh.
+        self._intervals = intervals
+        self._next_refresh = {}
+        # lockId -> values of TRACKED_LOCK_ATTRIBUTES at the last notification.
+        self._snapshot = {}
+        # True when values changed since the snapshot file was saved.
+        self._snapshot_dirty = False
+        # lockId -> failed attempts and monotonic time of the next retry of
+        # a stale battery level.
+        self._battery_retries = {}
+        # Monotonic time the next timer tick is expected at.
+        self._next_tick = None
+        self._topology_cached = False
+
+    @property
+    def tick_interval(self):
+        """Return the interval of the ticks, the shortest data class interval.
+
+        Staggered, the open state interval is divided by the number of slots.
+        """
+        if not self._stagger:
+            return min(self._intervals.values())
+        return max(
+            STAGGER_MIN_TICK,
+            min(
+                self._intervals[REFRESH_OPEN_STATE] / max(1, len(self._shards)),
+                *[
+                    _interval
+                    for _data_class, _interval in self._intervals.items()
+                    if _data_class != REFRESH_OPEN_STATE
+                ],
+            ),
+        )
+
+    @callback
+    def async_start(self):
+        """Start the ticks, they stop with Home Assistant."""
+        self._unsub_listeners = [
+            self._hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_stop)
+        ]
+        self._next_tick = time.monotonic() + self.tick_interval.total_seconds()
+        if self._stagger:
+            # The tick interval follows the number of slots.
+            self._rebalance()
+            self._async_schedule_tick()
+        else:
+            self._unsub_listeners.append(
+                async_track_time_interval(
+                    self._hass, self.async_refresh, self.tick_interval
+                )
+            )
+
+    @callback
+    def _async_schedule_tick(self):
+        self._unsub_tick = async_track_point_in_utc_time(
+            self._hass, self._async_tick, dt_util.utcnow() + self.tick_interval
+        )
+
+    async def _async_tick(self, now):
+        self._async_schedule_tick()
+        await self.async_refresh(now)
+
+    async def _async_stop(self, event):
+        """Stop the ticks and cancel the running cycle and its requests."""
+        for _unsub in self._unsub_listeners:
+            _unsub()
+        self._unsub_listeners = []
+        if self._unsub_tick is not None:
+            self._unsub_tick()
+            self._unsub_tick = None
+        if self._unsub_push is not None:
+            self._unsub_push()
+            self._unsub_push = None
+        self._api.token.async_stop()
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+        if self._snapshot_dirty:
+            await self._async_save_snapshot()
+        if self._api.records is not None:
+            await self._hass.async_add_executor_job(self._api.records.close)
+
+    def _due(self, now, force=False):
+        # Only a topology refresh due on schedule or forced bypasses the cache.
+        self._topology_cached = False
+        if force:
+            return set(self._intervals)
+        # Half a tick of tolerance so timer drift does not push a data class
+        # to the following tick.
+        _horizon = now + self.tick_interval / 2
+        _due = {
+            _data_class
+            for _data_class in self._intervals
+            if self._next_refresh.get(_data_class, now) <= _horizon
+        }
+        if self._stagger:
+            # Each tick polls the open state of its slot.
+            _due.add(REFRESH_OPEN_STATE)
+        if self._api.topology_invalidated and REFRESH_TOPOLOGY not in _due:
+            _due.add(REFRESH_TOPOLOGY)
+            self._topology_cached = True
+        return _due
+
+    async def async_refresh(self, event_time=None, force=False):
+        """Run a refresh cycle, or join the cycle in flight.
+
+        ``event_time`` is set for timer ticks, those are skipped while a cycle
+        runs and start after a random jitter. ``force`` refreshes every data
+        class.
+        """
+        _lag = 0
+        if event_time is not None:
+            # Lateness of the tick against its schedule, skipped ticks
+            # included, the timers schedule the next tick from this one.
+            _tick = time.monotonic()
+            _lag = max(0, _tick - self._next_tick)
+            self._next_tick = _tick + self.tick_interval.total_seconds()
+
+        if self._refresh_task is None:
+            self._refresh_task = self._hass.async_create_task(
+                self._async_refresh_cycle(event_time, force, _lag)
+            )
+        elif event_time is not None:
+            _LOGGER.debug("TTlock refresh still running, tick skipped")
+            self._api.metrics.record_skipped_tick()
+            return
+
+        # Shielded so a cancelled caller does not cancel the shared cycle.
+        await asyncio.shield(self._refresh_task)
+
+    async def _async_refresh_cycle(self, event_time, force, lag):
+        try:
+            await self._async_refresh_due(event_time, force, lag)
+        finally:
+            self._refresh_task = None
+
+    async def _async_refresh_due(self, event_time, force, lag):
+        """Refresh the due data classes and push the changes to the entities."""
+        _tick = time.monotonic()
+
+        _now = dt_util.utcnow()
+        _due = self._due(_now, force)
+        if not _due:
+            return
+
+        if event_time is not None and self._jitter:
+            await asyncio.sleep(random.uniform(0, self._jitter))
+            _tick = time.monotonic()
+
+        # The shortest interval of the due data classes, not the staggered
+        # slot, so the slower data classes get their own interval.
+        _deadline = (
+            self._hass.loop.time()
+            + (
+                self._cycle_timeout
+                or min(self._intervals[_data_class] for _data_class in _due)
+            ).total_seconds()
+        )
+        try:
+            _failed = await self._async_refresh(_due, _deadline, force)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            _LOGGER.error("Error while updating TTlock devices: %s", repr(error))
+        else:
+            # A failed data class is due again on the next tick.
+            for _data_class in _due - _failed:
+                self._next_refresh[_data_class] = _now + self._intervals[_data_class]
+
+        self._api.metrics.record_cycle(time.monotonic() - _tick, lag)
+        async_dispatcher_send(self._hass, SIGNAL_METRICS_UPDATED.format(self._api.name))
+
+        self.async_notify_changes()
+        # Open state changes alone are saved later, the snapshot is fsynced.
+        if REFRESH_TOPOLOGY in _due or (
+            REFRESH_ELECTRIC_QUANTITY in _due and self._snapshot_dirty
+        ):
+            await self._async_save_snapshot()
+
+    async def _async_save_snapshot(self):
+        self._snapshot_dirty = False
+        try:
+            await self._api.async_save_snapshot()
+        except OSError as error:
+            _LOGGER.warning("Unable to save the TTlock snapshot: %s", repr(error))
+
+    async def _async_refresh(self, due, deadline, force=False):
+        """Refresh the due data classes, return the ones that failed."""
+        _failed = set()
+        _new_locks = []
+        if REFRESH_TOPOLOGY in due:
+            _known = {lock.lock_id for lock in self._api.get_locks()}
+            try:
+                # Gateways whose lock list is late keep their last one.
+                await self._api.async_update_topology(deadline, self._topology_cached)
+            except (asyncio.TimeoutError, TTlockError) as error:
+                # The other data classes are refreshed for the known locks.
+                _LOGGER.warning(
+                    "Unable to update the TTlock topology of %s: %s",
+                    self._api.name,
+                    repr(error),
+                )
+                _failed.add(REFRESH_TOPOLOGY)
+            _new_locks = [
+                lock for lock in self._api.get_locks() if lock.lock_id not in _known
+            ]
+            if self._stagger:
+                self._rebalance()
+
+        # Locks found by the topology refresh get their values right away,
+        # locks with a stale battery level get it again once their backoff
+        # is over.
+        _requests = []
+        if REFRESH_ELECTRIC_QUANTITY in due:
+            _requests.append(self._async_refresh_electric_quantity(None, deadline))
+        else:
+            _now = time.monotonic()
+            _locks = _new_locks + [
+                lock
+                for lock in self._api.get_locks()
+                if REFRESH_ELECTRIC_QUANTITY in lock.stale
+                and lock not in _new_locks
+                and self._battery_retries.get(lock.lock_id, (0, 0))[1] <= _now
+            ]
+            if _locks:
+                _requests.append(
+                    self._async_refresh_electric_quantity(_locks, deadline)
+                )
+        if REFRESH_OPEN_STATE in due:
+            _requests.append(
+                self._async_refresh_open_state(
+                    self._next_shard() if self._stagger and not force else None,
+                    deadline,
+                )
+            )
+        elif _new_locks:
+            _requests.append(self._api.get_locks_open_state(_new_locks, deadline))
+        if REFRESH_RECORDS in due:
+            _requests.append(self._async_ingest_records(deadline))
+
+        await asyncio.gather(*_requests)
+        return _failed
+
+    async def _async_refresh_electric_quantity(self, locks, deadline):
+        """Query the battery levels, back off the retries of the stale ones.
+
+        The retry delay doubles from the tick interval up to the battery
+        interval.
+        """
+        await self._api.get_locks_electric_quantity(locks, deadline)
+        _now = time.monotonic()
+        _retries = {} if locks is None else self._battery_retries
+        for lock in self._api.get_locks() if locks is None else locks:
+            if REFRESH_ELECTRIC_QUANTITY not in lock.stale:
+                _retries.pop(lock.lock_id, None)
+                continue
+            _attempts = self._battery_retries.get(lock.lock_id, (0, 0))[0] + 1
+            _retries[lock.lock_id] = (
+                _attempts,
+                _now
+                + min(
+                    self._intervals[REFRESH_ELECTRIC_QUANTITY],
+                    self.tick_interval * 2 ** min(_attempts - 1, 16),
+                ).total_seconds(),
+            )
+        self._battery_retries = _retries
+
+    async def _async_ingest_records(self, deadline=None):
+        _count = await self._api.async_ingest_records(None, deadline)
+        if _count:
+            _LOGGER.debug("%d new TTlock lock records of %s", _count, self._api.name)
+
+    def _rebalance(self):
+        """Rebuild the shards from the locks of each gateway."""
+        _shards = []
+        _seen = set()
+        for _gateway_id in sorted(self._api.gateways):
+            _locks = [
+                lock
+                for lock in self._api.get_gateway_locks(_gateway_id)
+                if lock.lock_id not in _seen
+            ]
+            _seen.update(lock.lock_id for lock in _locks)
+            for _index in range(0, len(_locks), STAGGER_SHARD_SIZE):
+                _shards.append(_locks[_index : _index + STAGGER_SHARD_SIZE])
+
+        if len(_shards) != len(self._shards):
+            _LOGGER.debug(
+                "TTlock open states of %s polled in %d slots",
+                self._api.name,
+                len(_shards),
+            )
+        self._shards = _shards
+
+    def _next_shard(self):
+        """Return the locks of the next slot, None to poll every lock."""
+        if not self._shards:
+            return None
+        self._slot %= len(self._shards)
+        _shard = self._shards[self._slot]
+        self._slot += 1
+        return _shard
+
+    async def _async_refresh_open_state(self, locks=None, deadline=None):
+        """Poll the open states, push capable locks only every push_interval.
+
+        A polled state differing from the pushed one means events are missed,
+        the lock is polled on every cycle again.
+        """
+        if locks is None:
+            locks = self._api.get_locks()
+        _now = time.monotonic()
+        _locks = [
+            lock
+            for lock in locks
+            if lock.lock_id not in self._push_locks
+            or _now - self._push_locks[lock.lock_id] >= self._push_interval
+        ]
+        # lockId -> (confirmation time, open state) of the polled push locks.
+        _pushed = {
+            lock.lock_id: (self._push_locks[lock.lock_id], lock.state)
+            for lock in _locks
+            if lock.lock_id in self._push_locks
+        }
+        await self._api.get_locks_open_state(_locks, deadline)
+
+        for _lock_id, (_confirmed, _state) in _pushed.items():
+            if self._push_locks.get(_lock_id) != _confirmed:
+                # An event was pushed during the poll.
+                continue
+            lock = self._api.get_lock(_lock_id)
+            if lock is not None and REFRESH_OPEN_STATE in lock.stale:
+                # Not polled, the pushed state stays unconfirmed.
+                continue
+            if lock is None or lock.state != _state:
+                if lock is not None:
+                    _LOGGER.debug("TTlock lock %s missed a pushed event", _lock_id)
+                del self._push_locks[_lock_id]
+            else:
+                self._push_locks[_lock_id] = time.monotonic()
+
+    async def async_set_locked(self, lock_id, locked):
+        """Lock or unlock a lock, the same command in flight is joined."""
+        _state = LOCK_STATE_LOCKED if locked else LOCK_STATE_UNLOCKED
+        _pending = self._commands.get(lock_id)
+        if _pending is None or _pending[0] != _state:
+            _pending = self._commands[lock_id] = (
+                _state,
+                self._hass.async_create_task(
+                    self._async_set_locked(
+                        lock_id, _state, _pending[1] if _pending else None
+                    )
+                ),
+            )
+        # Shielded so a cancelled caller does not cancel the shared command.
+        await asyncio.shield(_pending[1])
+
+    async def _async_set_locked(self, lock_id, state, previous):
+        try:
+            if previous is not None:
+                # Commands to a lock are sent in order.
+                await asyncio.wait([previous])
+
+            lock = self._api.get_lock(lock_id)
+            if lock is None:
+                raise TTlockError("UNKNOWN_LOCK", lock_id)
+            _previous_state = lock.state
+            lock.state = state
+            self.async_notify_changes()
+            try:
+                if state == LOCK_STATE_LOCKED:
+                    await self._api.async_lock(lock)
+                else:
+                    await self._api.async_unlock(lock)
+            except Exception:
+                lock.state = _previous_state
+                self.async_notify_changes()
+                raise
+        finally:
+            if self._commands.get(lock_id, (None, None))[1] is asyncio.current_task():
+                del self._commands[lock_id]
+
+        self._hass.async_create_task(self._async_confirm_open_state(lock_id))
+
+    async def _async_confirm_open_state(self, lock_id):
+        await asyncio.sleep(COMMAND_CONFIRM_DELAY)
+        lock = self._api.get_lock(lock_id)
+        if lock is None:
+            return
+        try:
+            await self._api.get_lock_open_state(lock)
+        except TTlockError as error:
+            _LOGGER.debug(
+                "Unable to confirm the state of TTlock lock %s: %s",
+                lock_id,
+                repr(error),
+            )
+            return
+        self.async_notify_changes()
+
+    @callback
+    def async_push(self, lock_id, values):
+        """Queue LockState values pushed for a lock of the account.
+
+        Return False if the account has no such lock. The values queued
+        during CALLBACK_DEBOUNCE seconds are applied together.
+        """
+        if not self._api.has_lock(lock_id):
+            return False
+        self._pushed.setdefault(lock_id, {}).update(values)
+        if self._unsub_push is None:
+            self._unsub_push = async_call_later(
+                self._hass, CALLBACK_DEBOUNCE, self._async_apply_pushed
+            )
+        return True
+
+    @callback
+    def _async_apply_pushed(self, now):
+        self._unsub_push = None
+        _pushed, self._pushed = self._pushed, {}
+        for _lock_id, _values in _pushed.items():
+            lock = self._api.get_lock(_lock_id)
+            if lock is None:
+                continue
+            for key, value in _values.items():
+                setattr(lock, key, value)
+            if "state" in _values:
+                if _lock_id not in self._push_locks:
+                    _LOGGER.debug("TTlock lock %s pushes its events", _lock_id)
+                self._push_locks[_lock_id] = time.monotonic()
+        self.async_notify_changes()
+
+    @callback
+    def async_notify_changes(self):
+        """Send an update signal for each lock whose tracked values changed.
+
+        Return True if any lock changed.
+        """
+        _changed = False
+        _snapshot = {}
+        for lock in self._api.get_locks():
+            _lock_id = lock.lock_id
+            _values = tuple(getattr(lock, key) for key in TRACKED_LOCK_ATTRIBUTES)
+            _snapshot[_lock_id] = _values
+            if self._snapshot.get(_lock_id) != _values:
+                _changed = True
+                async_dispatcher_send(
+                    self._hass, SIGNAL_LOCK_UPDATED.format(self._api.name, _lock_id)
+                )
+
+        # Removed locks are signaled too so their entities become unavailable.
+        for _lock_id in self._snapshot.keys() - _snapshot.keys():
+            _changed = True
+            async_dispatcher_send(
+                self._hass, SIGNAL_LOCK_UPDATED.format(self._api.name, _lock_id)
+            )
+
+        self._snapshot = _snapshot
+        self._snapshot_dirty = self._snapshot_dirty or _changed
+        return _changed
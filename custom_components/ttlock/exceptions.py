@@ -0,0 +1,39 @@
+"""Exceptions for ttlock."""
+
+
+class TTlockError(Exception):
+    """Base class of the TTlock API errors."""
+
+
+class TTlockHttpError(TTlockError):
+    """The request failed or the API answered with a bad HTTP status.
+
+    ``status`` is None when no response was received.
+    """
+
+    def __init__(self, status, detail=None):
+        """Initialize the error."""
+        super().__init__("HTTP_ERROR", status if detail is None else detail)
+        self.status = status
+
+
+class TTlockApiError(TTlockError):
+    """The API answered with an errcode."""
+
+    def __init__(self, errcode, errmsg=None):
+        """Initialize the error."""
+        super().__init__("API_ERROR", errcode, errmsg)
+        self.errcode = errcode
+
+
+class TTlockTokenError(TTlockApiError):
+    """The access token is invalid or expired."""
+
+
+class TTlockCircuitOpenError(TTlockError):
+    """The endpoint failed too often, requests are not sent for a while."""
+
+    def __init__(self, endpoint):
+        """Initialize the error."""
+        super().__init__("CIRCUIT_OPEN", endpoint)
+        self.endpoint = endpoint
@@ -0,0 +1,67 @@
+"""Lock platform for ttlock."""
+from homeassistant.components.lock import DOMAIN, LockDevice
+from homeassistant.exceptions import HomeAssistantError
+from .const import DATA_COORDINATOR, LOCK_STATE_LOCKED, LOCK_STATE_UNLOCKED
+from .exceptions import TTlockError
+from custom_components.ttlock import DOMAIN as TTLOCK_DOMAIN
+from custom_components.ttlock import TTLockDevice
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    entities = []
+    for api in hass.data[TTLOCK_DOMAIN].values():
+        # The first command does not wait for the connection setup.
+        hass.async_create_task(api.async_warm_up())
+        coordinator = hass.data[DATA_COORDINATOR][api.name]
+        for device in api.get_locks():
+            entities.append(TTLockLock(hass, api, coordinator, device))
+
+    if len(entities):
+        async_add_entities(entities, update_before_add=False)
+
+
+class TTLockLock(TTLockDevice, LockDevice):
+    """Representation of a TTLock lock."""
+
+    def __init__(self, hass, api, coordinator, lock):
+        """Initialize the lock."""
+        TTLockDevice.__init__(self, hass, api, lock)
+        self._coordinator = coordinator
+        self._name = lock.name
+
+    # entity id is required if the name use other characters not in ascii
+    @property
+    def entity_id(self):
+        """Return the unique id of the lock."""
+        return "{}.{}_{}".format(DOMAIN, TTLOCK_DOMAIN, self._lockid)
+
+    @property
+    def name(self):
+        """Return the name of the lock."""
+        return self._name
+
+    @property
+    def is_locked(self):
+        """Return true if the lock is locked, None when unknown."""
+        lock = self.get_lock()
+        if lock is None or lock.state not in (LOCK_STATE_LOCKED, LOCK_STATE_UNLOCKED):
+            return None
+        return lock.state == LOCK_STATE_LOCKED
+
+    async def async_lock(self, **kwargs):
+        """Lock the lock."""
+        await self._async_set_locked(True)
+
+    async def async_unlock(self, **kwargs):
+        """Unlock the lock."""
+        await self._async_set_locked(False)
+
+    async def _async_set_locked(self, locked):
+        try:
+            await self._coordinator.async_set_locked(self._lockid, locked)
+        except TTlockError as error:
+            raise HomeAssistantError(
+                "Unable to {} {}: {}".format(
+                    "lock" if locked else "unlock", self._name, repr(error)
+                )
+            )
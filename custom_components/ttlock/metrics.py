@@ -0,0 +1,108 @@
+"""Request and poll cycle metrics for ttlock."""
+import bisect
+from collections import Counter
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed buckets."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """Initialize the histogram."""
+        self._buckets = buckets
+        self._counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self._counts[bisect.bisect_left(self._buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, quantile):
+        """Return the upper bound of the bucket holding the quantile."""
+        if not self.count:
+            return None
+        _rank = quantile * self.count
+        _seen = 0
+        for _bound, _count in zip(self._buckets, self._counts):
+            _seen += _count
+            if _seen >= _rank:
+                return _bound if _bound != float("inf") else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+            "buckets": {
+                str(_bound): _count
+                for _bound, _count in zip(self._buckets, self._counts)
+            },
+        }
+
+
+class TTlockMetrics:
+    """Counters and histograms of the requests and the poll cycles."""
+
+    def __init__(self):
+        """Initialize the metrics."""
+        self.requests = Counter()
+        self.errors = Counter()
+        self.retries = Counter()
+        self.latency = {}
+        self.token_refreshes = 0
+        self.cycles = 0
+        self.cycle_duration = LatencyHistogram()
+        self.last_cycle_duration = None
+        self.last_cycle_lag = None
+        self.skipped_ticks = 0
+
+    def record_request(self, endpoint, duration, error=None):
+        self.requests[endpoint] += 1
+        if error is not None:
+            self.errors[endpoint] += 1
+        _histogram = self.latency.get(endpoint)
+        if _histogram is None:
+            _histogram = self.latency[endpoint] = LatencyHistogram()
+        _histogram.record(duration)
+
+    def record_retry(self, endpoint):
+        self.retries[endpoint] += 1
+
+    def record_token_refresh(self):
+        self.token_refreshes += 1
+
+    def record_cycle(self, duration, lag):
+        """Record a poll cycle, lag is the delay of its start past its schedule."""
+        self.cycles += 1
+        self.cycle_duration.record(duration)
+        self.last_cycle_duration = duration
+        self.last_cycle_lag = lag
+
+    def record_skipped_tick(self):
+        self.skipped_ticks += 1
+
+    def as_dict(self):
+        return {
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "retries": dict(self.retries),
+            "latency": {
+                _endpoint: _histogram.as_dict()
+                for _endpoint, _histogram in self.latency.items()
+            },
+            "token_refreshes": self.token_refreshes,
+            "cycles": self.cycles,
+            "cycle_duration": self.cycle_duration.as_dict(),
+            "last_cycle_duration": self.last_cycle_duration,
+            "last_cycle_lag": self.last_cycle_lag,
+            "skipped_ticks": self.skipped_ticks,
+        }
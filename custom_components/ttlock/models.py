@@ -0,0 +1,67 @@
+"""Lock and gateway models for ttlock."""
+
+
+class Gateway:
+    """A gateway of the account and the ids of the locks it lists."""
+
+    __slots__ = ("gateway_id", "lock_ids")
+
+    def __init__(self, gateway_id):
+        """Initialize the gateway."""
+        self.gateway_id = gateway_id
+        self.lock_ids = []
+
+    @classmethod
+    def from_json(cls, data):
+        """Build the gateway from a v3/gateway/list item."""
+        return cls(data["gatewayId"])
+
+
+class LockState:
+    """The fields of a lock the entities use.
+
+    The other fields of the v3/gateway/listLock items are dropped when the
+    lock is parsed. ``stale`` holds the data classes (REFRESH_*) whose last
+    refresh failed, their values are the last good ones.
+    """
+
+    __slots__ = ("lock_id", "name", "rssi", "electric_quantity", "state", "stale")
+
+    def __init__(
+        self, lock_id, name=None, rssi=None, electric_quantity=None, state=None
+    ):
+        """Initialize the lock."""
+        self.lock_id = lock_id
+        self.name = name
+        self.rssi = rssi
+        self.electric_quantity = electric_quantity
+        self.state = state
+        self.stale = frozenset()
+
+    @classmethod
+    def from_json(cls, data):
+        """Build the lock from a listLock item or a snapshot entry."""
+        return cls(
+            data["lockId"],
+            data.get("lockName"),
+            data.get("rssi"),
+            data.get("electricQuantity"),
+            data.get("state"),
+        )
+
+    def update(self, data):
+        """Update the fields listed in data, a listLock item."""
+        self.name = data.get("lockName", self.name)
+        self.rssi = data.get("rssi", self.rssi)
+        self.electric_quantity = data.get("electricQuantity", self.electric_quantity)
+        self.state = data.get("state", self.state)
+
+    def as_json(self):
+        """Return the lock with the API field names, for the snapshot."""
+        return {
+            "lockId": self.lock_id,
+            "lockName": self.name,
+            "rssi": self.rssi,
+            "electricQuantity": self.electric_quantity,
+            "state": self.state,
+        }
@@ -0,0 +1,135 @@
+"""On-demand profiling of the ttlock refresh cycles."""
+import asyncio
+import functools
+import time
+
+from homeassistant.core import callback
+
+# TTlock methods recorded as spans: gateway pages, lock lists, battery and
+# open state queries, token refreshes, scheduled requests and their posts.
+API_SPANS = (
+    "async_update_topology",
+    "_get_page",
+    "get_locks_from_gateway",
+    "_update_lock_registry",
+    "get_locks_electric_quantity",
+    "_update_from_lock_list",
+    "get_locks_open_state",
+    "async_ingest_records",
+    "request_access_token",
+    "send_request",
+    "_post",
+)
+# TTlockCoordinator methods recorded as spans: the cycle, and the entity state
+# writes, done by the dispatcher callbacks of async_notify_changes.
+COORDINATOR_SPANS = ("_async_refresh_due", "async_notify_changes")
+
+
+class TTlockProfiler:
+    """Record the stages of the next refresh cycles as Chrome trace events.
+
+    The methods of API_SPANS and COORDINATOR_SPANS are wrapped by instance
+    attributes while the profile runs and restored after it, nothing is
+    wrapped nor recorded otherwise. Each account is a process of the trace,
+    each asyncio task a thread, so concurrent requests do not overlap.
+    """
+
+    def __init__(self, hass, accounts, cycles):
+        """Initialize the profiler of (TTlock, TTlockCoordinator) pairs."""
+        self._hass = hass
+        self._accounts = accounts
+        self._cycles = cycles
+        # id of the coordinator -> cycles left to profile.
+        self._remaining = {}
+        self._events = []
+        # asyncio task -> thread id of its spans.
+        self._tids = {}
+        self._start = None
+        self._done = None
+
+    @callback
+    def async_start(self):
+        """Wrap the profiled methods, the profile ends after the cycles."""
+        self._start = time.perf_counter()
+        self._done = self._hass.loop.create_future()
+        for _pid, (api, coordinator) in enumerate(self._accounts, 1):
+            self._events.append(
+                {
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": _pid,
+                    "args": {"name": api.name},
+                }
+            )
+            self._remaining[id(coordinator)] = self._cycles
+            for _name in API_SPANS:
+                self._wrap(api, _name, _pid)
+            for _name in COORDINATOR_SPANS:
+                self._wrap(coordinator, _name, _pid)
+
+    @callback
+    def async_stop(self):
+        """Restore the profiled methods."""
+        for api, coordinator in self._accounts:
+            for _name in API_SPANS:
+                vars(api).pop(_name, None)
+            for _name in COORDINATOR_SPANS:
+                vars(coordinator).pop(_name, None)
+        self._tids = {}
+        if not self._done.done():
+            self._done.set_result(None)
+
+    async def async_wait(self):
+        """Wait for the end of the profile and return the Chrome trace."""
+        await self._done
+        return {"traceEvents": self._events, "displayTimeUnit": "ms"}
+
+    def _wrap(self, obj, name, pid):
+        method = getattr(obj, name)
+
+        if asyncio.iscoroutinefunction(method):
+
+            @functools.wraps(method)
+            async def _wrapper(*args, **kwargs):
+                _start = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    self._record(name, pid, _start, args)
+                    if name == "_async_refresh_due":
+                        self._cycle_done(obj)
+
+        else:
+
+            @functools.wraps(method)
+            def _wrapper(*args, **kwargs):
+                _start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self._record(name, pid, _start, args)
+
+        setattr(obj, name, _wrapper)
+
+    def _record(self, name, pid, start, args):
+        if self._done.done():
+            # A span still running at the end of the profile.
+            return
+        _task = asyncio.current_task()
+        _event = {
+            "name": name,
+            "ph": "X",
+            "pid": pid,
+            "tid": self._tids.setdefault(_task, len(self._tids) + 1) if _task else 0,
+            "ts": (start - self._start) * 1e6,
+            "dur": (time.perf_counter() - start) * 1e6,
+        }
+        if args and isinstance(args[0], str):
+            # The resource of the request.
+            _event["args"] = {"resource": args[0]}
+        self._events.append(_event)
+
+    def _cycle_done(self, coordinator):
+        self._remaining[id(coordinator)] -= 1
+        if all(_remaining <= 0 for _remaining in self._remaining.values()):
+            self.async_stop()
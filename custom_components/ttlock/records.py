@@ -0,0 +1,118 @@
+"""Local store of the lock records for ttlock."""
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    lock_id INTEGER NOT NULL,
+    record_id INTEGER NOT NULL,
+    lock_date INTEGER NOT NULL,
+    server_date INTEGER,
+    record_type INTEGER,
+    success INTEGER,
+    username TEXT,
+    PRIMARY KEY (lock_id, record_id)
+);
+CREATE INDEX IF NOT EXISTS records_lock_date ON records (lock_id, lock_date);
+CREATE TABLE IF NOT EXISTS cursors (
+    lock_id INTEGER PRIMARY KEY,
+    lock_date INTEGER NOT NULL
+);
+"""
+
+# Record fields, in the column order of the records table.
+RECORD_FIELDS = (
+    "lockId",
+    "recordId",
+    "lockDate",
+    "serverDate",
+    "recordType",
+    "success",
+    "username",
+)
+
+
+class TTlockRecordStore:
+    """Append-only sqlite store of the lock records, indexed by lock and time.
+
+    The cursor of a lock is the lock time, in milliseconds, of its newest
+    stored record. Methods block, run them in the executor.
+    """
+
+    def __init__(self, filename):
+        """Initialize the store, the database is opened on first use."""
+        self._filename = filename
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._filename, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def cursor(self, lock_id):
+        """Return the lock time of the newest stored record of a lock, or None."""
+        with self._lock:
+            _row = (
+                self._connect()
+                .execute("SELECT lock_date FROM cursors WHERE lock_id = ?", (lock_id,))
+                .fetchone()
+            )
+        return _row[0] if _row else None
+
+    def append(self, lock_id, records):
+        """Store records of a lock, return the count of new records.
+
+        Records already stored are ignored, the cursor is not moved.
+        """
+        if not records:
+            return 0
+        with self._lock:
+            _connection = self._connect()
+            with _connection:
+                _before = _connection.total_changes
+                _connection.executemany(
+                    f"INSERT OR IGNORE INTO records VALUES "
+                    f"({', '.join('?' * len(RECORD_FIELDS))})",
+                    [
+                        (lock_id,) + tuple(record.get(key) for key in RECORD_FIELDS[1:])
+                        for record in records
+                    ],
+                )
+        return _connection.total_changes - _before
+
+    def move_cursor(self, lock_id, lock_date):
+        """Move the cursor of a lock forward to lock_date."""
+        with self._lock:
+            _connection = self._connect()
+            with _connection:
+                _connection.execute(
+                    "INSERT OR REPLACE INTO cursors SELECT ?, max(?, coalesce("
+                    "(SELECT lock_date FROM cursors WHERE lock_id = ?), 0))",
+                    (lock_id, lock_date, lock_id),
+                )
+
+    def query(self, lock_id, start=None, end=None):
+        """Return the records of a lock with start <= lockDate < end, oldest first."""
+        _sql = "SELECT * FROM records WHERE lock_id = ?"
+        _params = [lock_id]
+        if start is not None:
+            _sql += " AND lock_date >= ?"
+            _params.append(start)
+        if end is not None:
+            _sql += " AND lock_date < ?"
+            _params.append(end)
+        with self._lock:
+            _rows = (
+                self._connect()
+                .execute(_sql + " ORDER BY lock_date, record_id", _params)
+                .fetchall()
+            )
+        return [dict(zip(RECORD_FIELDS, _row)) for _row in _rows]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,235 @@
+"""Request scheduler for ttlock."""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+
+from .const import PRIORITY_COMMAND, RETRYABLE_ERRCODES, RETRYABLE_HTTP_CODES
+from .exceptions import (
+    TTlockApiError,
+    TTlockCircuitOpenError,
+    TTlockHttpError,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def is_retryable(error):
+    """Return True if the request that raised error may succeed when retried."""
+    if isinstance(error, TTlockHttpError):
+        return error.status is None or error.status in RETRYABLE_HTTP_CODES
+    if isinstance(error, TTlockApiError):
+        return error.errcode in RETRYABLE_ERRCODES
+    return False
+
+
+class CircuitBreaker:
+    """Stop sending requests to an endpoint after consecutive failures.
+
+    Once open, a single trial request is let through after reset_timeout
+    seconds, its success closes the circuit again. A cancelled trial frees
+    the slot for the next request.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        """Initialize the circuit breaker."""
+        self._threshold = threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def ready(self):
+        """Return True if a request may be sent, without taking the trial slot."""
+        return self._opened_at is None or (
+            not self._trial
+            and time.monotonic() - self._opened_at >= self._reset_timeout
+        )
+
+    def allow(self):
+        """Return True if a request may be sent, taking the trial slot if open."""
+        if not self.ready():
+            return False
+        if self._opened_at is not None:
+            self._trial = True
+        return True
+
+    def cancel(self):
+        """Free the trial slot of a request cancelled before its outcome."""
+        self._trial = False
+
+    def success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def failure(self):
+        self._failures += 1
+        if self._trial or self._failures >= self._threshold:
+            self._opened_at = time.monotonic()
+        self._trial = False
+
+
+class RequestScheduler:
+    """Send the TTlock requests within the API quota.
+
+    Requests take a token from a token bucket refilled at ``rate`` tokens
+    per second; waiting requests are served by priority (lowest value
+    first), then in turns between the accounts, then in arrival order. At
+    most ``concurrency`` requests are in flight. Retryable failures are
+    retried with an exponential backoff with full jitter, and each endpoint
+    has its own circuit breaker.
+
+    Commands, of PRIORITY_COMMAND, skip the waiting requests and the
+    concurrency bound. The token they take in advance delays the waiting
+    requests, so the rate is kept.
+    """
+
+    def __init__(
+        self,
+        rate,
+        burst,
+        concurrency,
+        max_retries,
+        backoff_base,
+        backoff_max,
+        breaker_threshold,
+        breaker_reset_timeout,
+    ):
+        """Initialize the scheduler."""
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._breaker_threshold = breaker_threshold
+        self._breaker_reset_timeout = breaker_reset_timeout
+        self.breakers = {}
+        # Heap of (priority, turn, arrival, future) of the requests waiting a
+        # token. An account takes the turn after its last waiting request, or
+        # after the turn being served, so accounts alternate.
+        self._waiters = []
+        self._arrival = itertools.count()
+        self._turns = {}
+        self._current_turn = 0
+        self._wakeup_handle = None
+
+    def breaker(self, endpoint):
+        """Return the circuit breaker of endpoint."""
+        _breaker = self.breakers.get(endpoint)
+        if _breaker is None:
+            _breaker = self.breakers[endpoint] = CircuitBreaker(
+                self._breaker_threshold, self._breaker_reset_timeout
+            )
+        return _breaker
+
+    async def async_run(self, endpoint, request, priority, account=None, metrics=None):
+        """Run request, a coroutine function, under the scheduler rules.
+
+        Retries are recorded in metrics, the TTlockMetrics of the account.
+        """
+        _breaker = self.breaker(endpoint)
+        _attempt = 0
+        while True:
+            if not _breaker.ready():
+                raise TTlockCircuitOpenError(endpoint)
+
+            await self._async_acquire(priority, account)
+            # The trial slot is taken once the request can be sent.
+            _trial = _breaker.is_open
+            if not _breaker.allow():
+                raise TTlockCircuitOpenError(endpoint)
+            try:
+                if priority <= PRIORITY_COMMAND:
+                    _result = await request()
+                else:
+                    async with self._semaphore:
+                        _result = await request()
+            except asyncio.CancelledError:
+                if _trial:
+                    _breaker.cancel()
+                raise
+            except Exception as error:
+                if not is_retryable(error):
+                    # The endpoint answered, it is not failing.
+                    _breaker.success()
+                    raise
+                _breaker.failure()
+                if _attempt >= self._max_retries or _breaker.is_open:
+                    raise
+                _delay = self._backoff(_attempt)
+                _attempt += 1
+                if metrics is not None:
+                    metrics.record_retry(endpoint)
+                _LOGGER.debug(
+                    "Retrying %s in %.1fs after %s", endpoint, _delay, repr(error)
+                )
+                await asyncio.sleep(_delay)
+                continue
+
+            _breaker.success()
+            return _result
+
+    def _backoff(self, attempt):
+        return random.uniform(
+            0, min(self._backoff_max, self._backoff_base * 2 ** attempt)
+        )
+
+    def _refill(self):
+        _now = time.monotonic()
+        self._tokens = min(
+            self._burst, self._tokens + (_now - self._updated_at) * self._rate
+        )
+        self._updated_at = _now
+
+    async def _async_acquire(self, priority, account):
+        self._refill()
+        if priority <= PRIORITY_COMMAND or (self._tokens >= 1 and not self._waiters):
+            self._tokens -= 1
+            return
+
+        _waiter = asyncio.get_event_loop().create_future()
+        _turn = self._turns[account] = (
+            max(self._turns.get(account, 0), self._current_turn) + 1
+        )
+        heapq.heappush(self._waiters, (priority, _turn, next(self._arrival), _waiter))
+        self._schedule_wakeup()
+        try:
+            await _waiter
+        except asyncio.CancelledError:
+            if _waiter.done() and not _waiter.cancelled():
+                # The token was granted to a cancelled request, give it back.
+                self._tokens += 1
+                self._wakeup()
+            raise
+
+    def _schedule_wakeup(self):
+        if self._wakeup_handle is not None:
+            return
+        self._wakeup_handle = asyncio.get_event_loop().call_later(
+            max(0, (1 - self._tokens) / self._rate), self._wakeup
+        )
+
+    def _wakeup(self):
+        if self._wakeup_handle is not None:
+            self._wakeup_handle.cancel()
+            self._wakeup_handle = None
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _turn, _, _waiter = heapq.heappop(self._waiters)
+            if _waiter.done():
+                continue
+            self._current_turn = max(self._current_turn, _turn)
+            self._tokens -= 1
+            _waiter.set_result(None)
+        if self._waiters:
+            self._schedule_wakeup()
@@ -1,37 +1,62 @@
 """Sensor platform for ttlock."""
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import Entity
-from .const import ATTRIBUTION, DEFAULT_NAME, ICON
+from .const import ATTRIBUTION, DEFAULT_NAME, ICON, SIGNAL_METRICS_UPDATED
 from homeassistant.components.sensor import DOMAIN
-from custom_components.ttlock import (DOMAIN as TTLOCK_DOMAIN, SonoffDevice)
+from custom_components.ttlock import DOMAIN as TTLOCK_DOMAIN
 from custom_components.ttlock import TTLockDevice
 
 
+# Sensors, keyed by LockState attribute.
 TTLOCK_SENSORS_MAP = {
-    "electricQuantity": {"eid": "battery", "uom": "%", "icon": "mdi:battery-outline"},
+    "electric_quantity": {"eid": "battery", "uom": "%", "icon": "mdi:battery-outline"},
+}
+
+# Diagnostic sensors, keyed by TTlockMetrics attribute.
+TTLOCK_DIAGNOSTIC_SENSORS_MAP = {
+    "last_cycle_duration": {
+        "eid": "cycle_duration",
+        "uom": "s",
+        "icon": "mdi:timer-outline",
+    },
+    "last_cycle_lag": {"eid": "cycle_lag", "uom": "s", "icon": "mdi:timer-sand"},
+    "requests": {"eid": "requests", "uom": "requests", "icon": "mdi:cloud-upload"},
+    "errors": {"eid": "request_errors", "uom": "errors", "icon": "mdi:cloud-alert"},
+    "retries": {"eid": "request_retries", "uom": "retries", "icon": "mdi:cloud-sync"},
+    "token_refreshes": {
+        "eid": "token_refreshes",
+        "uom": "refreshes",
+        "icon": "mdi:key-change",
+    },
 }
 
 
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     entities = []
-    for device in hass.data[DOMAIN].get_locks(force_update=False):
-        for sensor in TTLOCK_SENSORS_MAP.keys():
-            if device[sensor]:
-                entity = TTLockSensor(hass, device, sensor)
-                entities.append(entity)
+    for api in hass.data[TTLOCK_DOMAIN].values():
+        for device in api.get_locks():
+            for sensor in TTLOCK_SENSORS_MAP.keys():
+                if getattr(device, sensor) is not None:
+                    entity = TTLockSensor(hass, api, device, sensor)
+                    entities.append(entity)
+
+        for metric in TTLOCK_DIAGNOSTIC_SENSORS_MAP.keys():
+            entities.append(TTLockDiagnosticSensor(hass, api, metric))
 
     if len(entities):
         async_add_entities(entities, update_before_add=False)
 
 
 class TTLockSensor(TTLockDevice):
-    """Representation of a Sonoff sensor."""
+    """Representation of a TTLock sensor."""
 
-    def __init__(self, hass, lock, sensor=None):
+    def __init__(self, hass, api, lock, sensor=None):
         """Initialize the lock."""
-        TTLockDevice.__init__(self, hass, lock)
+        TTLockDevice.__init__(self, hass, api, lock)
         self._sensor = sensor
         self._name = "{} {}".format(
-            lock["lockName"], TTLOCK_SENSORS_MAP[self._sensor]["eid"]
+            lock.name, TTLOCK_SENSORS_MAP[self._sensor]["eid"]
         )
         self._attributes = {}
 
@@ -43,13 +68,14 @@ class TTLockSensor(TTLockDevice):
     @property
     def state(self):
         """Return the state of the sensor."""
-        return self.get_lock()[self._sensor]
+        lock = self.get_lock()
+        return getattr(lock, self._sensor) if lock else None
 
     # entity id is required if the name use other characters not in ascii
     @property
     def entity_id(self):
         """Return the unique id of the switch."""
-        entity_id = "{}.{}_{}_{}".format(DOMAIN, TTLOCK_DOMAIN, self._deviceid, TTLOCK_SENSORS_MAP[self._sensor]['eid'])
+        entity_id = "{}.{}_{}_{}".format(DOMAIN, TTLOCK_DOMAIN, self._lockid, TTLOCK_SENSORS_MAP[self._sensor]['eid'])
         return entity_id
 
     @property
@@ -61,3 +87,85 @@ class TTLockSensor(TTLockDevice):
     def name(self):
         """Return the name of the lock."""
         return self._name
+
+
+class TTLockDiagnosticSensor(Entity):
+    """Representation of a TTLock client metric."""
+
+    def __init__(self, hass, api, metric):
+        """Initialize the sensor."""
+        self._hass = hass
+        self._api = api
+        self._metric = metric
+        # Lock ids are unique across accounts, metrics are not.
+        _prefix = "TTlock" if api.name == DEFAULT_NAME else f"TTlock {api.name}"
+        self._name = "{} {}".format(
+            _prefix, TTLOCK_DIAGNOSTIC_SENSORS_MAP[metric]["eid"].replace("_", " ")
+        )
+        self._remove_signal_update = None
+
+    async def async_added_to_hass(self):
+        """Subscribe to the metric updates."""
+        self._remove_signal_update = async_dispatcher_connect(
+            self._hass,
+            SIGNAL_METRICS_UPDATED.format(self._api.name),
+            self._update_callback,
+        )
+
+    async def async_will_remove_from_hass(self):
+        """Unsubscribe from the metric updates."""
+        if self._remove_signal_update is not None:
+            self._remove_signal_update()
+            self._remove_signal_update = None
+
+    @callback
+    def _update_callback(self):
+        self.async_write_ha_state()
+
+    @property
+    def should_poll(self):
+        """Return the polling state, updates are pushed after each cycle."""
+        return False
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        value = getattr(self._api.metrics, self._metric)
+        if isinstance(value, dict):
+            return sum(value.values())
+        if isinstance(value, float):
+            return round(value, 3)
+        return value
+
+    @property
+    def device_state_attributes(self):
+        """Return the per endpoint details of the metric."""
+        metrics = self._api.metrics
+        if self._metric == "requests":
+            return {
+                endpoint: {
+                    "count": histogram.count,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                }
+                for endpoint, histogram in metrics.latency.items()
+            }
+        if self._metric == "last_cycle_duration":
+            return metrics.cycle_duration.as_dict()
+        value = getattr(metrics, self._metric)
+        return dict(value) if isinstance(value, dict) else None
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return TTLOCK_DIAGNOSTIC_SENSORS_MAP[self._metric]["uom"]
+
+    @property
+    def icon(self):
+        """Return the icon."""
+        return TTLOCK_DIAGNOSTIC_SENSORS_MAP[self._metric]["icon"]
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name